@@ -0,0 +1,93 @@
+"""Memory per forwarding job, idle and active.
+
+Measures with tracemalloc how many bytes one more job costs:
+
+- idle: a job parked in the scheduler between bursts (its record, plan,
+  retry queue and heap entry, no task);
+- active: a job whose engine task is running and waiting for a send slot
+  (the record plus the task, its coroutine frames and the scheduler wait).
+
+    python -m benchmarks.bench_job_memory [--json results.json]
+"""
+import asyncio
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.common import parse_args, quiet_logs, report
+from handlers.forward_handlers import ForwardJob, forward_handler
+from tests.fake_telegram import FakeTelegram
+from utils.planner import JobPlan
+from utils.progress_tracker import StatusMessage
+from utils.scheduler import scheduler
+from utils.virtual_time import run
+
+IDLE_JOBS = 10_000
+ACTIVE_JOBS = 1_000
+SOURCE = -100
+
+LIMITS = {
+    'idle_bytes_per_job': 2_500,
+    'active_bytes_per_job': 12_000,
+}
+
+def make_job(bot, user_id):
+    """A job over 100k ids, planned with the ~20 probes a real plan takes"""
+    channels = {
+        'source': {'id': SOURCE, 'title': 'Source', 'username': None},
+        'destination': {'id': -1_000_000 - user_id, 'title': 'Destination', 'username': None},
+    }
+    plan = JobPlan(999, 100, {index: 100 for index in (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 768,
+                                                       896, 960, 992, 999, 1000, 1001)})
+    return ForwardJob(user_id, bot, channels, plan, StatusMessage(bot, user_id, 1))
+
+def allocated():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+async def measure():
+    from telegram import Bot
+    fake = FakeTelegram({SOURCE: range(1, 100_001)})
+    bot = Bot('1:fake', request=fake)
+    await bot.initialize()
+    # Nobody gets a slot while we measure: every active engine waits in acquire
+    scheduler.global_rate = 1e-6
+
+    before = allocated()
+    for user_id in range(1, IDLE_JOBS + 1):
+        job = forward_handler.jobs[user_id] = make_job(bot, user_id)
+        forward_handler.park(job, 3600)
+    idle = (allocated() - before) / IDLE_JOBS
+
+    before = allocated()
+    for user_id in range(IDLE_JOBS + 1, IDLE_JOBS + ACTIVE_JOBS + 1):
+        job = forward_handler.jobs[user_id] = make_job(bot, user_id)
+        forward_handler.launch(job)
+    await asyncio.sleep(60)
+    active = (allocated() - before) / ACTIVE_JOBS
+    waiting = sum(not task.done() for task in forward_handler.active_jobs.values())
+
+    for task in forward_handler.active_jobs.values():
+        task.cancel()
+    await asyncio.gather(*forward_handler.active_jobs.values(), return_exceptions=True)
+    return idle, active, waiting
+
+def main():
+    args = parse_args(__doc__)
+    quiet_logs()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        tracemalloc.start()
+        idle, active, waiting = run(measure())
+        tracemalloc.stop()
+    metrics = {
+        'idle_bytes_per_job': idle,
+        'active_bytes_per_job': active,
+        'active_jobs_waiting': waiting,
+    }
+    return report('memory per job', metrics, LIMITS, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Live-post latency next to a 100k-message backfill.
+
+Drives the scheduler on the virtual-time loop at the default global rate.
+Three bulk jobs backfill 100k ids in batches of 100 while a live mirror
+posts one message every 0.2-0.8 s; the metric is how long a live post
+waits for its send slot:
+
+- without the backfill;
+- with the backfill, the live posts sent as bulk (no priorities);
+- with the backfill, the live posts sent as REALTIME.
+
+Another run checks that a higher-class job held back by its own user cap
+doesn't idle the slots bulk jobs could use, and a last one measures the
+CPU time 10,000 queued senders cost per second of loop time.
+
+    python -m benchmarks.bench_priority [--json results.json]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks.common import parse_args, percentile, quiet_logs, report
+from utils.scheduler import BULK, INTERACTIVE, PRIORITY_NAMES, REALTIME, ForwardScheduler
+from utils.virtual_time import run
+
+BACKFILL_MESSAGES = 100_000
+BULK_JOBS = 3
+BATCH = 100
+API_LATENCY = 0.05
+LIVE_USER = 0
+DURATION = 600.0  # seconds of live posts measured
+CAPPED_RATE = 1.0  # msg/sec cap of the interactive job in the idle-share run
+WAITERS = 10_000
+
+LIMITS = {
+    'realtime_p99_s': 5.0,           # at most about one bulk batch at the global rate
+    'idle_share_capped_higher': 0.1,  # share of the global rate left unused
+    'waiters_cpu_per_s': 0.05,        # CPU seconds per loop second with WAITERS queued
+}
+
+async def bulk_job(scheduler, user_id, messages, sent):
+    while messages > 0:
+        count = await scheduler.acquire(user_id, min(BATCH, messages), BULK)
+        await asyncio.sleep(API_LATENCY)
+        messages -= count
+        sent[0] += count
+
+async def live_posts(scheduler, priority, latencies):
+    loop = asyncio.get_running_loop()
+    rng = random.Random(1)
+    end = loop.time() + DURATION
+    posts = []
+
+    async def post():
+        queued = loop.time()
+        await scheduler.acquire(LIVE_USER, 1, priority)
+        latencies.append(loop.time() - queued)
+
+    while loop.time() < end:
+        posts.append(asyncio.create_task(post()))
+        await asyncio.sleep(rng.uniform(0.2, 0.8))
+    await asyncio.gather(*posts)
+
+async def live_latency(path, backfill, priority):
+    scheduler = ForwardScheduler(path=path)
+    sent = [0]
+    bulk = [
+        asyncio.create_task(bulk_job(scheduler, user_id, BACKFILL_MESSAGES // BULK_JOBS, sent))
+        for user_id in range(1, BULK_JOBS + 1)
+    ] if backfill else []
+    latencies = []
+    await live_posts(scheduler, priority, latencies)
+    for task in bulk:
+        task.cancel()
+    await asyncio.gather(*bulk, return_exceptions=True)
+    return latencies
+
+async def idle_share(path):
+    """Share of the global rate unused while a capped INTERACTIVE job waits next to bulk jobs"""
+    scheduler = ForwardScheduler(path=path)
+    scheduler.user_rates[LIVE_USER] = CAPPED_RATE
+    sent = [0]
+    tasks = [asyncio.create_task(bulk_job(scheduler, user_id, BACKFILL_MESSAGES, sent))
+             for user_id in range(1, BULK_JOBS + 1)]
+
+    async def capped():
+        while True:
+            await scheduler.acquire(LIVE_USER, 1, INTERACTIVE)
+            sent[0] += 1
+    tasks.append(asyncio.create_task(capped()))
+
+    await asyncio.sleep(10)  # warm up
+    loop = asyncio.get_running_loop()
+    start, before = loop.time(), sent[0]
+    await asyncio.sleep(120)
+    rate = (sent[0] - before) / (loop.time() - start)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return max(0.0, 1 - rate / scheduler.global_rate)
+
+async def waiter_cpu(path):
+    """CPU seconds per loop second while WAITERS senders of every class wait for slots"""
+    scheduler = ForwardScheduler(path=path)
+    tasks = [asyncio.create_task(scheduler.acquire(user_id, 1, user_id % len(PRIORITY_NAMES)))
+             for user_id in range(WAITERS)]
+    await asyncio.sleep(1)  # let every sender queue up
+    loop = asyncio.get_running_loop()
+    start, cpu = loop.time(), time.process_time()
+    await asyncio.sleep(60)
+    used = (time.process_time() - cpu) / (loop.time() - start)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return used
+
+def main():
+    args = parse_args(__doc__)
+    quiet_logs()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scheduler.json')
+        alone = run(live_latency(path, False, REALTIME))
+        no_priority = run(live_latency(path, True, BULK))
+        realtime = run(live_latency(path, True, REALTIME))
+        idle = run(idle_share(path))
+        waiters = run(waiter_cpu(path))
+    metrics = {
+        'no_backfill_p99_s': percentile(alone, 0.99),
+        'no_priority_p99_s': percentile(no_priority, 0.99),
+        'no_priority_live_sent': len(no_priority),
+        'realtime_p99_s': percentile(realtime, 0.99),
+        'realtime_live_sent': len(realtime),
+        'idle_share_capped_higher': idle,
+        'waiters_cpu_per_s': waiters,
+    }
+    return report('live-post latency next to a backfill', metrics, LIMITS, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Cold start: import time, /health readiness and time to first update.
+
+Each run is a fresh interpreter (a child of this script), the way a
+container starts. The child imports main, starts the health server, builds
+the bot against the fake Bot API with one /start update waiting, and runs
+polling until that update has been handled. Times are measured from the
+child's first line. The median of RUNS runs is compared against the limits.
+
+    python -m benchmarks.bench_startup [--json results.json]
+"""
+import time
+CHILD_START = time.perf_counter()
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RUNS = 5
+LIMITS = {
+    'import_main_ms': 150,
+    'health_ready_ms': 250,
+    'first_update_ms': 2000,
+}
+
+def child():
+    """One cold start; prints the metrics as JSON"""
+    import urllib.request
+    import main
+    imported = time.perf_counter()
+
+    server = main.keep_alive()
+    url = f"http://127.0.0.1:{server.server_address[1]}/health"
+    urllib.request.urlopen(url, timeout=5).read()
+    health_ready = time.perf_counter()
+
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from tests.fake_telegram import FakeTelegram
+
+    fake = FakeTelegram()
+    fake.command(1000, '/start')
+    bot = main.FastForwardBot(request=fake)
+
+    async def stop_after_first(update, context):
+        context.application.stop_running()
+    bot.application.add_handler(TypeHandler(Update, stop_after_first), group=99)
+    bot.application.run_polling(stop_signals=None, close_loop=False)
+    server.shutdown()
+
+    # main measures from its own import; shift to the child's first line
+    offset = (main.START_TIME - CHILD_START) * 1000
+    print(json.dumps({
+        'import_main_ms': (imported - CHILD_START) * 1000,
+        'health_ready_ms': (health_ready - CHILD_START) * 1000,
+        'first_update_ms': bot.first_update_ms + offset,
+    }))
+
+def main():
+    from benchmarks.common import parse_args, report
+    args = parse_args(__doc__)
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, BOT_TOKEN='1:fake', PORT='0', PYTHONPATH=repo)
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(RUNS):
+            result = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_startup', '--child'],
+                cwd=workdir, env=env, capture_output=True, text=True, timeout=60
+            )
+            if result.returncode != 0:
+                print(result.stdout + result.stderr)
+                return 1
+            runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    metrics = {key: statistics.median(run[key] for run in runs) for key in LIMITS}
+    return report(f'cold start, median of {RUNS}', metrics, LIMITS, args)
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        sys.exit(main())
@@ -0,0 +1,100 @@
+"""Button latency with 500 users clicking at once.
+
+Runs a real PTB Application against the fake Bot API on the virtual-time
+loop, once handling updates one at a time (PTB's default) and once with
+PerUserUpdateProcessor. A few users have a slow chat (every edit takes
+seconds); the metric is how long everyone else waits for their click to
+be handled. Also checks that each user's clicks are handled in order.
+
+    python -m benchmarks.bench_updates [--json results.json]
+"""
+import asyncio
+import random
+import sys
+
+from telegram import Update
+from telegram.ext import Application, CallbackQueryHandler
+
+from benchmarks.common import parse_args, percentile, quiet_logs, report
+from config import Config
+from tests.fake_telegram import FakeTelegram
+from utils.update_processor import PerUserUpdateProcessor
+from utils.virtual_time import run
+
+USERS = 500
+CLICKS_PER_USER = 3
+SPREAD = 10.0        # seconds over which the clicks arrive
+API_LATENCY = 0.05   # per Bot API call
+SLOW_USERS = 5
+SLOW_EDIT = 3.0      # extra seconds per edit in a slow user's chat
+
+LIMITS = {
+    'per_user_p50_s': 0.2,
+    'per_user_p99_s': 0.5,
+    'order_violations': 0,
+}
+
+async def simulate(processor):
+    fake = FakeTelegram(latency=API_LATENCY)
+    for user_id in range(1, SLOW_USERS + 1):
+        fake.chat_latencies[user_id] = SLOW_EDIT
+    builder = Application.builder().token('1:fake').request(fake).get_updates_request(fake)
+    application = builder.concurrent_updates(processor).build()
+
+    loop = asyncio.get_running_loop()
+    queued_at = {}
+    latencies = []
+    handled = {}
+
+    async def click(update, context):
+        query = update.callback_query
+        await query.answer()
+        await query.edit_message_text(f"clicked {query.data}")
+        handled.setdefault(query.from_user.id, []).append(int(query.data))
+        if query.from_user.id > SLOW_USERS:
+            latencies.append(loop.time() - queued_at[update.update_id])
+
+    application.add_handler(CallbackQueryHandler(click))
+    await application.initialize()
+    await application.start()
+
+    rng = random.Random(1)
+    clicks = sorted(
+        (rng.uniform(0, SPREAD), user_id, n)
+        for user_id in range(1, USERS + 1) for n in range(CLICKS_PER_USER)
+    )
+    # Click numbers must rise in arrival order for the order check
+    counters = {}
+    start = loop.time()
+    for at, user_id, _ in clicks:
+        await asyncio.sleep(max(0.0, start + at - loop.time()))
+        number = counters[user_id] = counters.get(user_id, -1) + 1
+        update_id = fake.click(user_id, str(number))
+        update = Update.de_json(fake.updates.pop(), application.bot)
+        queued_at[update_id] = loop.time()
+        await application.update_queue.put(update)
+
+    while sum(len(numbers) for numbers in handled.values()) < USERS * CLICKS_PER_USER:
+        await asyncio.sleep(0.1)
+    await application.stop()
+    await application.shutdown()
+
+    violations = sum(numbers != sorted(numbers) for numbers in handled.values())
+    return latencies, violations
+
+def main():
+    args = parse_args(__doc__)
+    quiet_logs()
+    sequential, _ = run(simulate(False))
+    per_user, violations = run(simulate(PerUserUpdateProcessor(Config.MAX_CONCURRENT_UPDATES)))
+    metrics = {
+        'sequential_p50_s': percentile(sequential, 0.5),
+        'sequential_p99_s': percentile(sequential, 0.99),
+        'per_user_p50_s': percentile(per_user, 0.5),
+        'per_user_p99_s': percentile(per_user, 0.99),
+        'order_violations': violations,
+    }
+    return report('update latency, 500 users', metrics, LIMITS, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""Shared reporting for the benchmarks.
+
+Every benchmark prints its metrics next to a limit and exits non-zero when
+one is exceeded, so they can run in CI as regression checks. ``--json``
+writes the metrics to a file for tracking over time.
+"""
+import argparse
+import json
+import logging
+import math
+
+def parse_args(description, argv=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--json', help="write the metrics to this file")
+    return parser.parse_known_args(argv)[0]
+
+def percentile(values, share):
+    """Nearest-rank percentile of `values` (share between 0 and 1)"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+def report(name, metrics, limits, args=None):
+    """Print metrics with their limits; return the process exit code"""
+    print(f"{name}:")
+    failed = []
+    for key, value in metrics.items():
+        limit = limits.get(key)
+        over = limit is not None and value > limit
+        if over:
+            failed.append(key)
+        note = f"  (limit {limit:g}{', EXCEEDED' if over else ''})" if limit is not None else ''
+        print(f"  {key:<32} {value:>12.3f}{note}")
+    if args is not None and args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': name, 'metrics': metrics, 'limits': limits, 'failed': failed}, f, indent=2)
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")
+        return 1
+    return 0
+
+def quiet_logs():
+    """Keep per-message warnings out of benchmark output"""
+    logging.basicConfig(level=logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
@@ -0,0 +1,173 @@
+"""Virtual-time soak run of the forwarding engine.
+
+Runs forward_engine, the scheduler and the analytics rollups on the
+virtual-time loop against the fake Bot API, at the real burst/rest
+settings, for --hours simulated hours (24 by default). One user forwards
+job after job of JOB_IDS ids with 5% deleted messages and 0.2% timeouts,
+always from the same source to the same destination, so the run also
+covers many job lifecycles and every job rewrites the last one's message
+map.
+
+Windows go out as whole batches, as they do by default; with
+--map-partial-batches (MAP_PARTIAL_BATCHES) every gappy window is sent one
+message per request instead, which makes a 24-hour run take about half an
+hour instead of about five minutes.
+
+Every simulated hour it samples RSS, tracemalloc, the size of the
+message map files, the number of asyncio tasks and the hour's forwarding
+rate. After a warm-up hour it fails when memory or the map files keep
+growing, tasks pile up, or the hourly rate drifts or exceeds the cap.
+
+    python -m benchmarks.soak [--hours 24] [--map-partial-batches] [--json results.json]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import resource
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.common import quiet_logs, report
+from tests.fake_telegram import TIMEOUT, FakeTelegram
+
+SOURCE = -100
+DESTINATION = -200
+USER_ID = 1
+JOB_IDS = 105_000
+WINDOW = 100
+GAP_EVERY = 10        # one id in 10 of every other window is a deleted message (5% overall)
+TIMEOUT_RATE = 0.002  # share of forward requests that time out
+API_LATENCY = 0.01
+WARM_UP_HOURS = 1
+
+LIMITS = {
+    'tracemalloc_growth_kb': 512,
+    'rss_growth_mb': 32,
+    'map_disk_growth_kb': 256,
+    'max_tasks': 10,
+    'rate_drift': 0.05,    # (fastest - slowest hour) / slowest hour
+    'rate_over_cap': 1.0,  # fastest hour / global rate
+}
+
+class GappyChannel:
+    """Message ids 1..last minus every GAP_EVERY-th of every other window, without storing them.
+
+    The windows in between come back full, so their messages get mapped.
+    """
+
+    def __init__(self, last):
+        self.last = last
+
+    def __contains__(self, message_id):
+        gappy = (message_id - 1) // WINDOW % 2 == 0
+        return 1 <= message_id <= self.last and not (gappy and message_id % GAP_EVERY == 7)
+
+def rss_bytes():
+    """Current resident set size (peak size where /proc isn't available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def directory_bytes(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path)) if os.path.isdir(path) else 0
+
+def start_job(bot):
+    from database.job_manager import job_manager
+    from handlers.forward_handlers import ForwardJob, forward_handler
+    from utils.planner import JobPlan
+    from utils.progress_tracker import StatusMessage
+    channels = {
+        'source': {'id': SOURCE, 'title': 'Source', 'username': None},
+        'destination': {'id': DESTINATION, 'title': 'Destination', 'username': None},
+    }
+    job = ForwardJob(USER_ID, bot, channels, JobPlan(JOB_IDS // WINDOW - 1, WINDOW), StatusMessage(bot, USER_ID, 1))
+    forward_handler.jobs[USER_ID] = job
+    job_manager.save_job(USER_ID, job.state())
+    forward_handler.launch(job)
+
+async def soak(hours):
+    from config import Config
+    from telegram import Bot
+    from database.analytics import analytics
+    from handlers.forward_handlers import forward_handler
+    from utils.scheduler import scheduler
+
+    fake = FakeTelegram(latency=API_LATENCY)
+    fake.channels[SOURCE] = GappyChannel(JOB_IDS)
+    fake.fail_randomly('forwardMessages', TIMEOUT_RATE, TIMEOUT)
+    bot = Bot('1:fake', request=fake)
+    await bot.initialize()
+    rollups = asyncio.create_task(analytics.run_rollups())
+
+    loop = asyncio.get_running_loop()
+    samples = []
+    jobs = 0
+    for hour in range(1, hours + 1):
+        hour_end = loop.time() + 3600
+        while loop.time() < hour_end:
+            if USER_ID not in forward_handler.jobs:
+                jobs += 1
+                start_job(bot)
+            await asyncio.sleep(min(60, hour_end - loop.time()))
+        # The fake keeps every forwarded message; count and drop them so the
+        # harness itself doesn't grow
+        forwarded = sum(len(messages) for messages in fake.forwarded.values())
+        fake.forwarded.clear()
+        fake.edits.clear()
+        gc.collect()
+        samples.append({
+            'forwarded': forwarded,
+            'traced': tracemalloc.get_traced_memory()[0],
+            'rss': rss_bytes(),
+            'map_bytes': directory_bytes(Config.MESSAGE_MAP_DIR),
+            'tasks': len(asyncio.all_tasks()),
+        })
+        print(f"  hour {hour:>3}: {forwarded / 3600:6.2f} msg/s, {samples[-1]['tasks']} tasks, "
+              f"{samples[-1]['traced'] / 1024:8.0f} KB traced, {samples[-1]['rss'] / 2 ** 20:6.1f} MB RSS")
+
+    rollups.cancel()
+    await forward_handler.shutdown(0)
+    return samples, jobs, scheduler.global_rate
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--map-partial-batches', action='store_true', help="send gappy windows message by message")
+    parser.add_argument('--json', help="write the metrics to this file")
+    args = parser.parse_args()
+    if args.hours <= WARM_UP_HOURS + 1:
+        parser.error(f"--hours must be more than {WARM_UP_HOURS + 1}")
+    quiet_logs()
+
+    from config import Config
+    from utils.virtual_time import run
+    Config.MAP_PARTIAL_BATCHES = args.map_partial_batches
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        tracemalloc.start()
+        samples, jobs, rate = run(soak(args.hours))
+        tracemalloc.stop()
+
+    # The last hour may end mid-rest, so rates are compared over full hours
+    # after the warm-up only
+    steady = samples[WARM_UP_HOURS:]
+    rates = [sample['forwarded'] / 3600 for sample in steady[:-1]]
+    metrics = {
+        'simulated_hours': args.hours,
+        'jobs_run': jobs,
+        'messages_forwarded': sum(sample['forwarded'] for sample in samples),
+        'tracemalloc_growth_kb': (steady[-1]['traced'] - steady[0]['traced']) / 1024,
+        'rss_growth_mb': (steady[-1]['rss'] - steady[0]['rss']) / 2 ** 20,
+        'map_disk_growth_kb': (steady[-1]['map_bytes'] - steady[0]['map_bytes']) / 1024,
+        'max_tasks': max(sample['tasks'] for sample in samples),
+        'rate_drift': (max(rates) - min(rates)) / min(rates),
+        'rate_over_cap': max(rates) / rate,
+    }
+    return report('soak', metrics, LIMITS, args)
+
+if __name__ == '__main__':
+    sys.exit(main())
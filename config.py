@@ -5,7 +5,12 @@ class Config:
     BOT_TOKEN = os.getenv('BOT_TOKEN')
     
     # Speed Configuration - 25 MESSAGES/SECOND 🚀
-    MAX_SPEED = 25  # messages per second
+    MAX_SPEED = 25  # messages per second (default global cap, adjustable by admins at runtime)
+    MAX_ALLOWED_SPEED = 30  # hard ceiling for runtime rate changes
+    SCHEDULER_TICK = 0.1  # seconds of timer lateness a send may make up for without counting as a burst
+    INTERACTIVE_JOB_MESSAGES = 1000  # jobs up to this size outrank bulk backfills
+    BULK_MIN_SHARE = 0.2  # share of recent send slots bulk jobs keep under contention
+    PRIORITY_WINDOW = 50  # recent grants the bulk share is measured over
     BURST_DURATION = 300  # 5 minutes in seconds
     REST_DURATION = 30  # 30 seconds rest
     
@@ -13,9 +18,20 @@ class Config:
     MAX_MESSAGES_PER_JOB = 100000
     MAX_JOBS_PER_USER = 3
     
+    # Update Processing
+    MAX_CONCURRENT_UPDATES = 64  # handlers running at once across all users
+    
     # Forwarding Settings
     DEFAULT_DELAY = 0.04  # 25 msg/second (1/25 = 0.04)
+    BATCH_SIZE = 100  # message ids per forward_messages request (Bot API max)
+    PROBE_EMPTY_WINDOWS = 2  # empty batches in a row that mark the end of a source
+    PROBE_END_CHECKS = 8  # probes 1, 2, 4... windows further out that must be empty too before the end is trusted
+    PROBE_CHAT_ID = os.getenv('PROBE_CHAT_ID')  # scratch chat for planning probes; jobs can't be planned without it
+    MAX_RETRIES = 5  # attempts for a batch that failed with a network error
+    RETRY_BASE_DELAY = 2  # seconds, doubled on each attempt (with jitter)
+    RETRY_MAX_DELAY = 300  # seconds
     PROGRESS_UPDATE_INTERVAL = 100  # Update every 100 messages
+    SHUTDOWN_GRACE_PERIOD = 10  # seconds running jobs get to checkpoint on SIGTERM
     
     # Channel Settings
     ALLOW_PUBLIC_CHANNELS = True
@@ -24,11 +40,27 @@ class Config:
     
     # Database Settings (we'll use simple dict for now)
     USE_DATABASE = False  # Set to True for production
+    JOBS_FILE = os.getenv('JOBS_FILE', 'jobs_state.json')  # running jobs, for resume after restart
+    SCHEDULER_FILE = os.getenv('SCHEDULER_FILE', 'scheduler_state.json')  # runtime rate caps, quotas, drain mode
+    ANALYTICS_DIR = os.getenv('ANALYTICS_DIR', 'analytics')  # hourly rollups, one file per user
+    ANALYTICS_ROLLUP_INTERVAL = 60  # seconds between rollup/flush passes
+    ANALYTICS_PEAK_WINDOW = 20  # seconds averaged for peak rates (several paced batches, so one batch isn't a spike)
+    DEAD_LETTER_DIR = os.getenv('DEAD_LETTER_DIR', 'dead_letters')  # messages jobs gave up on
+    MESSAGE_MAP_DIR = os.getenv('MESSAGE_MAP_DIR', 'message_maps')  # source -> destination message ids
+    MESSAGE_MAPS_OPEN = 64  # map files kept open at once; the least recently used are closed
+    MAP_PARTIAL_BATCHES = False  # True sends windows that may have gaps one id per request so each is mapped (up to 100x the requests)
+    
+    # Health Check Server
+    HEALTH_PORT = int(os.getenv('PORT', '8080'))
     
     # Logging Configuration
     LOG_LEVEL = "INFO"
     LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     
+    # Operators allowed to use admin commands (comma-separated Telegram user ids)
+    ADMIN_IDS = {int(i) for i in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if i}
+    ADMIN_PANEL_JOBS = 20  # busiest jobs listed (with buttons) in the admin panel; the rest are only counted
+    
     # Bot Information
     BOT_USERNAME = "@Speed_Fast_Forward_bot"  # Update with your bot username
     SUPPORT_CHAT = "https://t.me/Oggybotz"  # Update if you have support channel
@@ -40,10 +72,13 @@ class Config:
             print("❌ BOT_TOKEN is not set in environment variables")
             return False
         
-        if cls.MAX_SPEED > 30:
-            print("❌ MAX_SPEED cannot exceed 30 messages/second")
+        if cls.MAX_SPEED > cls.MAX_ALLOWED_SPEED:
+            print(f"❌ MAX_SPEED cannot exceed {cls.MAX_ALLOWED_SPEED} messages/second")
             return False
         
+        if not cls.PROBE_CHAT_ID:
+            print("⚠️ PROBE_CHAT_ID is not set: new forwarding jobs can't be planned")
+        
         required_vars = {
             'BOT_TOKEN': cls.BOT_TOKEN,
             'MAX_SPEED': cls.MAX_SPEED,
@@ -60,10 +95,3 @@ class Config:
         print(f"🚀 Bot configured for {cls.MAX_SPEED} messages/second")
         print(f"⏰ Burst-Rest Cycle: {cls.BURST_DURATION}s ON → {cls.REST_DURATION}s OFF")
         return True
-
-# Validate configuration but don't exit if fails
-try:
-    Config.validate_config()
-except Exception as e:
-    print(f"⚠️ Configuration check had issues: {e}")
-    print("🔧 Continuing anyway...")
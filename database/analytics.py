@@ -1 +1,311 @@
+import asyncio
+import logging
+import math
+import os
+import struct
+import time
+from array import array
 
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# One finished minute for one destination:
+# minute (epoch minutes), destination id, forwarded, errors, throttled seconds,
+# peak msg/sec over ANALYTICS_PEAK_WINDOW
+MINUTE_RECORD = struct.Struct('<IqIIHH')
+# One finished hour for one destination:
+# hour (epoch hours), destination id, forwarded, errors, throttle minutes, peak msg/sec
+HOUR_RECORD = struct.Struct('<IqIIHH')
+# One finished job: started (epoch secs), duration secs, destination id, forwarded, errors
+JOB_RECORD = struct.Struct('<IIqII')
+
+def _minutes(seconds):
+    """Throttled seconds as minutes, rounded up"""
+    return -(-seconds // 60)
+
+class _Series:
+    """Hot, constant-size counters for one (user, destination) pair.
+
+    Per-second counts live in 60-slot ring buffers. Every finished minute
+    becomes a fixed-size record and is folded into the open hour, and every
+    finished hour becomes one too; both wait to be written to disk. A
+    throttle marks every second it covers, so a long RetryAfter shows up in
+    each minute it spans.
+    """
+
+    __slots__ = ('second', 'forwarded', 'errors', 'throttled', 'throttled_until',
+                 'hour', 'hour_forwarded', 'hour_errors', 'hour_throttled', 'hour_peak')
+
+    def __init__(self, now):
+        self.second = now
+        self.forwarded = array('I', bytes(4 * 60))
+        self.errors = array('I', bytes(4 * 60))
+        self.throttled = array('I', bytes(4 * 60))
+        self.throttled_until = 0
+        self.hour = now // 3600
+        self.hour_forwarded = 0
+        self.hour_errors = 0
+        self.hour_throttled = 0  # seconds
+        self.hour_peak = 0
+
+    def advance(self, now, finished_minutes, finished_hours):
+        """Move the ring to second `now`, rolling up every finished minute/hour"""
+        if now <= self.second:
+            return
+        while now // 60 != self.second // 60:
+            minute_end = self.second - self.second % 60 + 59
+            self._step(minute_end)
+            minute = self._close_minute()
+            if any(minute[1:]):
+                finished_minutes.append(minute)
+            # Minutes a throttle still covers get records of their own; idle ones are skipped
+            following = minute_end + 1 if self.throttled_until > minute_end + 1 else now
+            if following // 3600 != self.hour:
+                if self.hour_forwarded or self.hour_errors or self.hour_throttled:
+                    finished_hours.append(self.hour_record())
+                self.hour = following // 3600
+                self.hour_forwarded = self.hour_errors = self.hour_throttled = self.hour_peak = 0
+            self._step(following)
+        self._step(now)
+
+    def _step(self, now):
+        for second in range(max(self.second + 1, now - 59), now + 1):
+            slot = second % 60
+            self.forwarded[slot] = self.errors[slot] = 0
+            self.throttled[slot] = 1 if second < self.throttled_until else 0
+        self.second = max(self.second, now)
+
+    def throttle(self, seconds):
+        self.throttled_until = max(self.throttled_until, self.second + max(1, math.ceil(seconds)))
+        self.throttled[self.second % 60] = 1
+
+    def _peak(self, slots):
+        """Highest messages/second over any ANALYTICS_PEAK_WINDOW seconds of the first `slots`"""
+        window = max(1, min(Config.ANALYTICS_PEAK_WINDOW, 60))
+        total = peak = 0
+        for slot in range(slots):
+            total += self.forwarded[slot]
+            if slot >= window:
+                total -= self.forwarded[slot - window]
+            peak = max(peak, total)
+        return round(peak / window)
+
+    def _close_minute(self):
+        # The ring holds exactly the 60 seconds of the minute being closed
+        minute = (
+            self.second // 60, sum(self.forwarded), sum(self.errors),
+            sum(self.throttled), min(self._peak(60), 0xFFFF)
+        )
+        self.hour_forwarded += minute[1]
+        self.hour_errors += minute[2]
+        self.hour_throttled += minute[3]
+        self.hour_peak = max(self.hour_peak, minute[4])
+        return minute
+
+    def open_totals(self):
+        """Counts recorded in the open hour, including the open minute"""
+        slots = self.second % 60 + 1
+        return (
+            self.hour_forwarded + sum(self.forwarded[:slots]),
+            self.hour_errors + sum(self.errors[:slots]),
+            _minutes(self.hour_throttled + sum(self.throttled[:slots])),
+            max(self.hour_peak, self._peak(slots)),
+        )
+
+    def hour_record(self):
+        return (self.hour, self.hour_forwarded, self.hour_errors,
+                min(_minutes(self.hour_throttled), 0xFFFF), min(self.hour_peak, 0xFFFF))
+
+    def rate(self, window):
+        """Average messages/second over the last `window` finished seconds"""
+        window = max(1, min(window, 59))
+        return sum(self.forwarded[(self.second - i) % 60] for i in range(1, window + 1)) / window
+
+    def is_idle(self):
+        """True once everything recorded here has been rolled out to disk"""
+        return not (
+            self.hour_forwarded or self.hour_errors or self.hour_throttled
+            or any(self.forwarded) or any(self.errors) or any(self.throttled)
+            or self.throttled_until > self.second
+        )
+
+class Analytics:
+    """Throughput, error and throttle history per user and destination.
+
+    Recent activity is kept in fixed-size ring buffers; finished minutes and
+    hours are appended to small binary files per user (`.minutes`, `.hours`),
+    so memory stays constant no matter how much history accumulates.
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path or Config.ANALYTICS_DIR
+        self.clock = clock
+        self.series = {}   # (user_id, destination_id) -> _Series
+        self.pending_minutes = {}  # user_id -> list of packed records waiting for flush
+        self.pending = {}          # same, for hour records
+        self.pending_jobs = {}
+
+    # ==================== RECORDING ====================
+    def _series(self, user_id, destination_id):
+        now = int(self.clock())
+        key = (user_id, destination_id or 0)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(now)
+        else:
+            self._advance(key, series, now)
+        return series, now % 60
+
+    def _advance(self, key, series, now):
+        minutes, hours = [], []
+        series.advance(now, minutes, hours)
+        for finished, record, pending in ((minutes, MINUTE_RECORD, self.pending_minutes),
+                                          (hours, HOUR_RECORD, self.pending)):
+            if finished:
+                records = pending.setdefault(key[0], [])
+                for period, forwarded, errors, throttled, peak in finished:
+                    records.append(record.pack(period, key[1], forwarded, errors, throttled, peak))
+
+    def record_forwarded(self, user_id, destination_id, count=1):
+        series, slot = self._series(user_id, destination_id)
+        series.forwarded[slot] += count
+
+    def record_error(self, user_id, destination_id, count=1):
+        series, slot = self._series(user_id, destination_id)
+        series.errors[slot] += count
+
+    def record_throttle(self, user_id, destination_id, seconds=1):
+        """Mark the next `seconds` seconds as throttled (e.g. a RetryAfter)"""
+        series, _ = self._series(user_id, destination_id)
+        series.throttle(seconds)
+
+    def record_job(self, user_id, destination_id, started_at, forwarded, errors=0):
+        """Log a finished job (started_at is an epoch timestamp)"""
+        duration = max(0, int(self.clock() - started_at))
+        self.pending_jobs.setdefault(user_id, []).append(
+            JOB_RECORD.pack(int(started_at), duration, destination_id or 0, forwarded, errors)
+        )
+
+    # ==================== ROLLUPS ====================
+    def tick(self):
+        """Roll every series forward to now and drop the ones gone idle"""
+        now = int(self.clock())
+        for key, series in list(self.series.items()):
+            self._advance(key, series, now)
+            if series.is_idle():
+                del self.series[key]
+
+    def flush(self):
+        """Append finished minutes, hours and jobs to disk"""
+        if not self.pending_minutes and not self.pending and not self.pending_jobs:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for suffix, pending in (('minutes', self.pending_minutes), ('hours', self.pending),
+                                    ('jobs', self.pending_jobs)):
+                for user_id in list(pending):
+                    with open(self._file(user_id, suffix), 'ab') as f:
+                        f.write(b''.join(pending[user_id]))
+                    # Drop each user's records as soon as they are written, so a
+                    # failure later in the loop can't write them twice
+                    del pending[user_id]
+        except OSError as e:
+            logger.error(f"Could not write analytics to {self.path}: {e}")
+
+    async def run_rollups(self):
+        """Background loop: roll up and flush every ANALYTICS_ROLLUP_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(Config.ANALYTICS_ROLLUP_INTERVAL)
+            self.tick()
+            self.flush()
+
+    # ==================== QUERIES ====================
+    def _file(self, user_id, suffix):
+        return os.path.join(self.path, f"{user_id}.{suffix}")
+
+    def _records(self, user_id, suffix, record, pending):
+        try:
+            with open(self._file(user_id, suffix), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        data = data[:len(data) - len(data) % record.size] + b''.join(pending.get(user_id, ()))
+        return record.iter_unpack(data)
+
+    def _hour_records(self, user_id):
+        return self._records(user_id, 'hours', HOUR_RECORD, self.pending)
+
+    def user_totals(self, user_id, since=None, until=None):
+        """Totals for one user, optionally limited to [since, until) epoch seconds.
+
+        Returns forwarded, errors, throttle_minutes, peak_rate and a
+        per-destination breakdown of forwarded messages.
+        """
+        first_hour = int(since // 3600) if since is not None else 0
+        last_hour = int(until // 3600) if until is not None else None
+        totals = {'forwarded': 0, 'errors': 0, 'throttle_minutes': 0, 'peak_rate': 0, 'destinations': {}}
+
+        def add(hour, destination_id, forwarded, errors, throttle_minutes, peak):
+            if hour < first_hour or (last_hour is not None and hour > last_hour):
+                return
+            totals['forwarded'] += forwarded
+            totals['errors'] += errors
+            totals['throttle_minutes'] += throttle_minutes
+            totals['peak_rate'] = max(totals['peak_rate'], peak)
+            destinations = totals['destinations']
+            destinations[destination_id] = destinations.get(destination_id, 0) + forwarded
+
+        # Advance first so hours that just finished are already in pending
+        now = int(self.clock())
+        open_series = [(key, series) for key, series in self.series.items() if key[0] == user_id]
+        for key, series in open_series:
+            self._advance(key, series, now)
+        for record in self._hour_records(user_id):
+            add(*record)
+        for (_, destination_id), series in open_series:
+            add(series.hour, destination_id, *series.open_totals())
+        return totals
+
+    def minute_history(self, user_id, since=None):
+        """Finished minutes of one user, oldest first, optionally from `since` (epoch seconds)"""
+        now = int(self.clock())
+        for key, series in list(self.series.items()):
+            if key[0] == user_id:
+                self._advance(key, series, now)
+        first_minute = int(since // 60) if since is not None else 0
+        return [
+            {'minute': minute * 60, 'destination': destination_id, 'forwarded': forwarded,
+             'errors': errors, 'throttled_seconds': throttled, 'peak_rate': peak}
+            for minute, destination_id, forwarded, errors, throttled, peak
+            in self._records(user_id, 'minutes', MINUTE_RECORD, self.pending_minutes)
+            if minute >= first_minute
+        ]
+
+    def live_rate(self, user_id, window=5):
+        """Current messages/second for one user across all destinations"""
+        now = int(self.clock())
+        rate = 0.0
+        for key, series in list(self.series.items()):
+            if key[0] == user_id:
+                self._advance(key, series, now)
+                rate += series.rate(window)
+        return rate
+
+    def job_history(self, user_id, limit=10):
+        """Most recent finished jobs, newest first"""
+        try:
+            with open(self._file(user_id, 'jobs'), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        data = data[:len(data) - len(data) % JOB_RECORD.size] + b''.join(self.pending_jobs.get(user_id, ()))
+        jobs = [
+            {'started_at': started, 'duration': duration, 'destination': destination_id,
+             'forwarded': forwarded, 'errors': errors}
+            for started, duration, destination_id, forwarded, errors in JOB_RECORD.iter_unpack(data)
+        ]
+        return jobs[::-1][:limit]
+
+# Create global instance
+analytics = Analytics()
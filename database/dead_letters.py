@@ -0,0 +1,67 @@
+import glob
+import json
+import logging
+import os
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class DeadLetterLog:
+    """Messages a job gave up on, one JSON line per message, one file per job.
+
+    Users can export the file or replay it once the cause is fixed.
+    """
+
+    def __init__(self, user_id, job_id, path=None):
+        self.user_id = user_id
+        self.job_id = job_id
+        self.path = path or Config.DEAD_LETTER_DIR
+        self.count = len(self.entries())
+
+    @property
+    def file(self):
+        return os.path.join(self.path, f"{self.user_id}-{self.job_id}.jsonl")
+
+    @classmethod
+    def latest(cls, user_id, path=None):
+        """Log of the user's most recent job that has one, or None"""
+        path = path or Config.DEAD_LETTER_DIR
+        job_ids = []
+        for file in glob.glob(os.path.join(path, f"{user_id}-*.jsonl")):
+            job_id = os.path.basename(file)[len(f"{user_id}-"):-len('.jsonl')]
+            if job_id.isdigit():
+                job_ids.append(int(job_id))
+        return cls(user_id, max(job_ids), path) if job_ids else None
+
+    def add(self, message_ids, reason):
+        lines = [
+            json.dumps({'message_id': message_id, 'reason': reason, 'failed_at': int(time.time())})
+            for message_id in message_ids
+        ]
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.file, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            self.count += len(lines)
+        except OSError as e:
+            logger.error(f"Could not write dead letters for user {self.user_id}: {e}")
+
+    def entries(self):
+        try:
+            with open(self.file, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def remove(self, message_ids):
+        """Drop entries that were delivered on replay"""
+        message_ids = set(message_ids)
+        remaining = [entry for entry in self.entries() if entry['message_id'] not in message_ids]
+        if remaining:
+            with open(self.file, 'w', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(entry) + '\n' for entry in remaining))
+        elif os.path.exists(self.file):
+            os.remove(self.file)
+        self.count = len(remaining)
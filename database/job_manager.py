@@ -1 +1,84 @@
+import json
+import logging
+import os
+from datetime import datetime
 
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class JobManager:
+    """Persist forwarding job state so jobs survive a restart.
+
+    State is a small JSON file keyed by user id. It is only read on first
+    access, so importing this module (and starting the bot) stays cheap.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.JOBS_FILE
+        self._jobs = None  # loaded lazily
+
+    @property
+    def jobs(self):
+        """All persisted jobs, loading the state file on first use"""
+        if self._jobs is None:
+            self._jobs = self._load()
+        return self._jobs
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read job state {self.path}: {e}")
+            return {}
+        return {int(user_id): job for user_id, job in raw.items()}
+
+    def save_job(self, user_id, job):
+        """Store (or replace) the state of one user's job and write it out"""
+        self.jobs[user_id] = job
+        self.flush()
+
+    def update_job(self, user_id, flush=True, **fields):
+        """Update fields of an existing job and write it out (unless flush=False)"""
+        if user_id in self.jobs:
+            self.jobs[user_id].update(fields)
+            if flush:
+                self.flush()
+
+    def remove_job(self, user_id):
+        """Forget a finished job"""
+        if self.jobs.pop(user_id, None) is not None:
+            self.flush()
+
+    def get_job(self, user_id):
+        return self.jobs.get(user_id)
+
+    def resumable_jobs(self):
+        """Jobs that were running when the last process exited.
+
+        Paused and quota-stopped jobs stay saved but wait for their user to
+        resume them (ForwardHandlers.resume_forwarding).
+        """
+        return {user_id: job for user_id, job in self.jobs.items() if job.get('status') == 'running'}
+
+    def flush(self):
+        """Write the state file atomically"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({str(k): v for k, v in self.jobs.items()}, f, default=self._encode)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not write job state {self.path}: {e}")
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError(f"Cannot store {type(value).__name__} in job state")
+
+# Create global instance
+job_manager = JobManager()
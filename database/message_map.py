@@ -0,0 +1,246 @@
+import logging
+import mmap
+import os
+import struct
+from collections import OrderedDict
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 256  # source ids per block
+BLOCK_BASE = struct.Struct('<q')  # destination id the block's deltas count from
+DELTA = struct.Struct('<H')
+BLOCK_DELTAS = struct.Struct(f'<{BLOCK_SIZE}H')  # all deltas of a block at once
+BLOCK_BYTES = BLOCK_BASE.size + BLOCK_DELTAS.size
+GROW_BLOCKS = 64  # the file grows this many blocks at a time
+
+UNMAPPED = 0
+OVERFLOW = 0xFFFF  # delta doesn't fit, look in the overflow file
+OVERFLOW_SLACK = 1024  # stale overflow lines allowed beyond the live ones before the file is compacted
+
+class MessageMap:
+    """Destination message id of every source message copied to one destination.
+
+    Source ids are split into blocks of BLOCK_SIZE. Block N sits at a fixed
+    offset in a memory-mapped file and holds a base destination id plus one
+    2-byte delta per source id, so a lookup is one offset calculation and
+    two reads. Destination ids of a block are close together because jobs
+    forward in id order, so the delta almost always fits. The rare one that
+    doesn't goes to a small overflow file. That comes to about two bytes per
+    mapping. When the same source is forwarded to the destination again,
+    its blocks are rebased onto the new ids, and overflow entries that get
+    overwritten are dropped (the file is compacted once most of it is stale).
+    """
+
+    def __init__(self, source_id, destination_id, path=None):
+        self.source_id = source_id
+        self.destination_id = destination_id
+        self.path = path or Config.MESSAGE_MAP_DIR
+        self._file = None
+        self._map = None
+        self._overflow = None  # loaded lazily
+        self._overflow_lines = 0  # lines in the overflow file, live or stale
+
+    @property
+    def file(self):
+        return os.path.join(self.path, f"{self.source_id}_{self.destination_id}.map")
+
+    @property
+    def overflow_file(self):
+        return f"{self.file}.overflow"
+
+    def _open(self, size=0):
+        """Map the file, growing it to at least `size` bytes"""
+        if self._file is None:
+            if not size and not os.path.exists(self.file):
+                return False
+            os.makedirs(self.path, exist_ok=True)
+            self._file = open(self.file, 'r+b' if os.path.exists(self.file) else 'w+b')
+        current = os.fstat(self._file.fileno()).st_size
+        if size > current:
+            blocks = -(-size // BLOCK_BYTES)
+            size = -(-blocks // GROW_BLOCKS) * GROW_BLOCKS * BLOCK_BYTES
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._file.truncate(size)
+            current = size
+        if self._map is None and current:
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        return self._map is not None
+
+    def _delta_offset(self, source_id):
+        block, slot = divmod(source_id, BLOCK_SIZE)
+        return block * BLOCK_BYTES + BLOCK_BASE.size + slot * DELTA.size
+
+    def _overflow_ids(self):
+        """Overflow entries still in use, loaded on first need (the map must be open)"""
+        if self._overflow is None:
+            self._overflow = {}
+            self._overflow_lines = 0
+            try:
+                with open(self.overflow_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        source_id, destination_id = (int(value) for value in line.split())
+                        self._overflow_lines += 1
+                        offset = self._delta_offset(source_id)
+                        if offset < len(self._map) and DELTA.unpack_from(self._map, offset)[0] == OVERFLOW:
+                            self._overflow[source_id] = destination_id
+            except FileNotFoundError:
+                pass
+        return self._overflow
+
+    def get(self, source_id):
+        """Destination id the source message was copied to, or None"""
+        offset = source_id // BLOCK_SIZE * BLOCK_BYTES
+        if not self._open() or offset + BLOCK_BYTES > len(self._map):
+            return None
+        delta, = DELTA.unpack_from(self._map, self._delta_offset(source_id))
+        if delta == UNMAPPED:
+            return None
+        if delta == OVERFLOW:
+            return self._overflow_ids().get(source_id)
+        base, = BLOCK_BASE.unpack_from(self._map, offset)
+        return base + delta - 1
+
+    def _rewrite(self, block, block_pairs, overflow, freed):
+        """Write pairs into a block some of them don't fit, rebasing it if that overflows less"""
+        offset = block * BLOCK_BYTES
+        old_base, = BLOCK_BASE.unpack_from(self._map, offset)
+        old = BLOCK_DELTAS.unpack_from(self._map, offset + BLOCK_BASE.size)
+        entries = {}  # slot -> destination id, after this write
+        for slot, delta in enumerate(old):
+            if delta == OVERFLOW:
+                destination_id = self._overflow_ids().get(block * BLOCK_SIZE + slot)
+                if destination_id is not None:
+                    entries[slot] = destination_id
+            elif delta != UNMAPPED:
+                entries[slot] = old_base + delta - 1
+        for source_id, destination_id in block_pairs:
+            entries[source_id % BLOCK_SIZE] = destination_id
+
+        # The source forwarded here again moves a block's ids far on: count
+        # from the lowest id that fits with the new ones, unless the old base
+        # still fits more of the block
+        def misfits(base):
+            return sum(not 0 < destination_id - base + 1 < OVERFLOW for destination_id in entries.values())
+        newest = max(destination_id for _, destination_id in block_pairs)
+        new_base = min(destination_id for destination_id in entries.values() if newest - destination_id < OVERFLOW - 1)
+        base = old_base if old_base and misfits(old_base) <= misfits(new_base) else new_base
+
+        values = [UNMAPPED] * BLOCK_SIZE
+        for slot, destination_id in entries.items():
+            source_id = block * BLOCK_SIZE + slot
+            delta = destination_id - base + 1
+            if 0 < delta < OVERFLOW:
+                values[slot] = delta
+                if old[slot] == OVERFLOW:
+                    freed.append(source_id)
+            else:
+                values[slot] = OVERFLOW
+                if old[slot] != OVERFLOW or self._overflow_ids().get(source_id) != destination_id:
+                    overflow.append((source_id, destination_id))
+        BLOCK_BASE.pack_into(self._map, offset, base)
+        BLOCK_DELTAS.pack_into(self._map, offset + BLOCK_BASE.size, *values)
+
+    def add(self, pairs):
+        """Record a batch of (source id, destination id) pairs"""
+        pairs = list(pairs)
+        if not pairs:
+            return
+        self._open((max(source_id for source_id, _ in pairs) // BLOCK_SIZE + 1) * BLOCK_BYTES)
+        blocks = {}
+        for source_id, destination_id in pairs:
+            blocks.setdefault(source_id // BLOCK_SIZE, []).append((source_id, destination_id))
+        overflow, freed = [], []
+        for block, block_pairs in blocks.items():
+            base, = BLOCK_BASE.unpack_from(self._map, block * BLOCK_BYTES)
+            if not base:
+                base = min(destination_id for _, destination_id in block_pairs)
+                BLOCK_BASE.pack_into(self._map, block * BLOCK_BYTES, base)
+            if not all(0 < destination_id - base + 1 < OVERFLOW for _, destination_id in block_pairs):
+                self._rewrite(block, block_pairs, overflow, freed)
+                continue
+            for source_id, destination_id in block_pairs:
+                offset = self._delta_offset(source_id)
+                if DELTA.unpack_from(self._map, offset)[0] == OVERFLOW:
+                    freed.append(source_id)
+                DELTA.pack_into(self._map, offset, destination_id - base + 1)
+
+        if overflow or freed:
+            overflow_ids = self._overflow_ids()
+            for source_id in freed:
+                overflow_ids.pop(source_id, None)
+            overflow_ids.update(overflow)
+            if self._overflow_lines + len(overflow) > 2 * len(overflow_ids) + OVERFLOW_SLACK:
+                self._compact()
+            elif overflow:
+                with open(self.overflow_file, 'a', encoding='utf-8') as f:
+                    f.write(''.join(f"{source_id} {destination_id}\n" for source_id, destination_id in overflow))
+                self._overflow_lines += len(overflow)
+
+    def _compact(self):
+        """Rewrite the overflow file with only the entries still in use"""
+        tmp_path = f"{self.overflow_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(f"{source_id} {destination_id}\n" for source_id, destination_id in self._overflow.items()))
+        os.replace(tmp_path, self.overflow_file)
+        self._overflow_lines = len(self._overflow)
+
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class MessageMaps:
+    """Open message maps, one per (source, destination) pair.
+
+    At most MESSAGE_MAPS_OPEN maps keep their file open; the least recently
+    used one is closed when another is needed, and a job's map is released
+    when the job ends. A closed map reopens its file on next use.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.maps = OrderedDict()
+
+    def get(self, source_id, destination_id):
+        key = (source_id, destination_id)
+        if key in self.maps:
+            self.maps.move_to_end(key)
+            return self.maps[key]
+        while len(self.maps) >= Config.MESSAGE_MAPS_OPEN:
+            _, oldest = self.maps.popitem(last=False)
+            oldest.close()
+        message_map = self.maps[key] = MessageMap(source_id, destination_id, self.path)
+        return message_map
+
+    def lookup(self, source_id, destination_id, message_id):
+        """Destination id of a copied source message, or None"""
+        return self.get(source_id, destination_id).get(message_id)
+
+    def release(self, source_id, destination_id):
+        """Close one pair's map, e.g. when the job writing it ends"""
+        message_map = self.maps.pop((source_id, destination_id), None)
+        if message_map is not None:
+            message_map.close()
+
+    def flush(self):
+        for message_map in self.maps.values():
+            message_map.flush()
+
+    def close(self):
+        for message_map in self.maps.values():
+            message_map.close()
+        self.maps.clear()
+
+# Create global instance
+message_maps = MessageMaps()
@@ -1 +1,193 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import heapq
+import logging
 
+from config import Config
+from database.analytics import analytics
+from handlers.forward_handlers import forward_handler
+from utils.scheduler import PRIORITY_NAMES, scheduler
+
+logger = logging.getLogger(__name__)
+
+class AdminHandlers:
+    """Operator-only commands for watching and steering load at runtime"""
+
+    def is_admin(self, user_id):
+        return user_id in Config.ADMIN_IDS
+
+    async def reject(self, update):
+        if update.callback_query:
+            await update.callback_query.answer("⛔ Admins only", show_alert=True)
+        else:
+            await update.message.reply_text("⛔ This command is for bot admins only.")
+
+    def shown_jobs(self):
+        """The ADMIN_PANEL_JOBS busiest jobs: sending ones first, then by messages forwarded.
+
+        Telegram messages are capped at 4096 characters, so the panel can't
+        list every job once there are a few dozen.
+        """
+        jobs = forward_handler.running_jobs()
+        return heapq.nlargest(
+            Config.ADMIN_PANEL_JOBS, jobs.items(),
+            key=lambda item: (item[0] in forward_handler.active_jobs, item[1].messages_forwarded)
+        )
+
+    def panel_text(self):
+        """The busiest jobs with live rates, plus current capacity settings"""
+        jobs = forward_handler.running_jobs()
+        shown = self.shown_jobs()
+        lines = []
+        for user_id, job in shown:
+            cap = scheduler.user_rates.get(user_id)
+            lines.append(
+                f"• `{user_id}` - {job.messages_forwarded} msgs, "
+                f"{analytics.live_rate(user_id):.1f} msg/s, {job.running_minutes()} min, "
+                f"{PRIORITY_NAMES[job.priority]}"
+                + (f", cap {cap}/s" if cap else "")
+            )
+        if len(jobs) > len(shown):
+            lines.append(f"…and {len(jobs) - len(shown)} more (use /pausejob or /killjob)")
+
+        return f"""
+🛠️ **ADMIN CONTROL PANEL**
+
+⚡ **Global Rate:** {scheduler.global_rate} msg/sec
+🚰 **Drain Mode:** {'ON - no new jobs' if scheduler.draining else 'OFF'}
+📊 **Running Jobs:** {len(jobs)} ({scheduler.parked_count} resting)
+
+{chr(10).join(lines) if lines else 'No jobs running.'}
+
+**Commands:**
+/setrate <msg/s> - global rate cap
+/setuserrate <user> <msg/s|off> - per-user cap
+/setquota <user> <msgs/day|off> - per-user quota
+/pausejob <user> - pause a job
+/killjob <user> - stop a job
+/drain <on|off> - stop accepting new jobs"""
+
+    def panel_keyboard(self):
+        keyboard = []
+        for user_id, _ in self.shown_jobs():
+            keyboard.append([
+                InlineKeyboardButton(f"⏸️ PAUSE {user_id}", callback_data=f"admin_pause_{user_id}"),
+                InlineKeyboardButton(f"🛑 KILL {user_id}", callback_data=f"admin_kill_{user_id}")
+            ])
+        keyboard.append([
+            InlineKeyboardButton("🔄 REFRESH", callback_data="admin_refresh"),
+            InlineKeyboardButton("🚰 DRAIN OFF" if scheduler.draining else "🚰 DRAIN ON", callback_data="admin_drain")
+        ])
+        return InlineKeyboardMarkup(keyboard)
+
+    # ==================== COMMANDS ====================
+    async def admin_command(self, update, context):
+        """Show the admin panel"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        await update.message.reply_text(self.panel_text(), reply_markup=self.panel_keyboard(), parse_mode='Markdown')
+
+    async def set_rate_command(self, update, context):
+        """/setrate <msg/s>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        try:
+            scheduler.set_global_rate(float(context.args[0]))
+        except (IndexError, ValueError) as e:
+            await update.message.reply_text(f"❌ Usage: /setrate <msg/s> ({e})")
+            return
+        await update.message.reply_text(f"✅ Global rate set to {scheduler.global_rate} msg/sec")
+
+    async def set_user_rate_command(self, update, context):
+        """/setuserrate <user_id> <msg/s|off>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        try:
+            user_id = int(context.args[0])
+            rate = None if context.args[1].lower() == 'off' else float(context.args[1])
+            scheduler.set_user_rate(user_id, rate)
+        except (IndexError, ValueError) as e:
+            await update.message.reply_text(f"❌ Usage: /setuserrate <user> <msg/s|off> ({e})")
+            return
+        await update.message.reply_text(
+            f"✅ Rate cap for {user_id}: {f'{rate} msg/sec' if rate else 'removed'}"
+        )
+
+    async def set_quota_command(self, update, context):
+        """/setquota <user_id> <messages/day|off>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        try:
+            user_id = int(context.args[0])
+            quota = None if context.args[1].lower() == 'off' else int(context.args[1])
+            scheduler.set_quota(user_id, quota)
+        except (IndexError, ValueError) as e:
+            await update.message.reply_text(f"❌ Usage: /setquota <user> <msgs/day|off> ({e})")
+            return
+        await update.message.reply_text(
+            f"✅ Daily quota for {user_id}: {f'{quota} messages' if quota is not None else 'removed'}"
+        )
+
+    async def pause_job_command(self, update, context):
+        """/pausejob <user_id>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        try:
+            user_id = int(context.args[0])
+        except (IndexError, ValueError):
+            await update.message.reply_text("❌ Usage: /pausejob <user>")
+            return
+        forward_handler.pause_job(user_id)
+        await update.message.reply_text(f"⏸️ Job of {user_id} paused")
+
+    async def kill_job_command(self, update, context):
+        """/killjob <user_id>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        try:
+            user_id = int(context.args[0])
+        except (IndexError, ValueError):
+            await update.message.reply_text("❌ Usage: /killjob <user>")
+            return
+        forward_handler.stop_job(user_id)
+        await update.message.reply_text(f"🛑 Job of {user_id} stopped")
+
+    async def drain_command(self, update, context):
+        """/drain <on|off>"""
+        if not self.is_admin(update.effective_user.id):
+            await self.reject(update)
+            return
+        if not context.args or context.args[0].lower() not in ('on', 'off'):
+            await update.message.reply_text("❌ Usage: /drain <on|off>")
+            return
+        scheduler.set_draining(context.args[0].lower() == 'on')
+        await update.message.reply_text(
+            f"🚰 Drain mode {'ON - running jobs will finish, no new jobs accepted' if scheduler.draining else 'OFF'}"
+        )
+
+    # ==================== BUTTONS ====================
+    async def admin_click(self, update, context):
+        """Handle admin panel buttons"""
+        query = update.callback_query
+        if not self.is_admin(query.from_user.id):
+            await self.reject(update)
+            return
+        await query.answer()
+
+        data = query.data
+        if data == "admin_drain":
+            scheduler.set_draining(not scheduler.draining)
+        elif data.startswith("admin_pause_"):
+            forward_handler.pause_job(int(data[len("admin_pause_"):]))
+        elif data.startswith("admin_kill_"):
+            forward_handler.stop_job(int(data[len("admin_kill_"):]))
+
+        await query.edit_message_text(self.panel_text(), reply_markup=self.panel_keyboard(), parse_mode='Markdown')
+
+# Create global instance
+admin_handler = AdminHandlers()
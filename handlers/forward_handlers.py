@@ -1,17 +1,157 @@
 import asyncio
 import logging
+import time
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from datetime import datetime
+from config import Config
+from database.analytics import analytics
+from database.dead_letters import DeadLetterLog
+from database.job_manager import job_manager
+from database.message_map import message_maps
+from utils.errors import FATAL, RATE_LIMITED, RETRYABLE, SKIP, RetryQueue, classify_error, retry_after_seconds
+from utils.formatters import format_duration
+from utils.helpers import chat_ref, loop_time
+from utils.planner import JobPlan, JobPlanner, bot_probe
+from utils.progress_tracker import StatusMessage
+from utils.scheduler import BULK, INTERACTIVE, scheduler
 
 logger = logging.getLogger(__name__)
 
+# Saved jobs that wait for their user to continue them
+RESUMABLE_STATUSES = ('paused', 'quota_reached')
+
+class ForwardJob:
+    """All state of one user's forwarding job.
+    
+    Kept in slots and plain numbers so that thousands of jobs fit in one
+    process: the cursor is the next window index, retries are ranges of
+    ids, and the dead-letter log is only opened once something fails. A job
+    that is resting is parked as this record alone, with no task behind it.
+    """
+    
+    __slots__ = ('user_id', 'bot', 'channels', 'source', 'destination', 'source_id', 'destination_id',
+                 'plan', 'status_message', 'started_at', 'messages_forwarded', 'next_window',
+                 'status', 'retries', 'dead_letters', 'quota_reached', 'priority', 'empty_tail')
+    
+    def __init__(self, user_id, bot, user_channels, plan, status_message,
+                 started_at=None, messages_forwarded=0, next_window=0, retry_items=()):
+        self.user_id = user_id
+        self.bot = bot
+        self.channels = user_channels
+        self.source = chat_ref(user_channels['source'])
+        self.destination = chat_ref(user_channels['destination'])
+        self.source_id = user_channels['source'].get('id')
+        self.destination_id = user_channels['destination'].get('id')
+        self.plan = plan
+        self.status_message = status_message
+        self.started_at = time.time() if started_at is None else started_at
+        self.messages_forwarded = messages_forwarded
+        self.next_window = next_window
+        self.status = 'running'
+        self.retries = RetryQueue(retry_items)
+        self.dead_letters = None
+        self.quota_reached = False
+        self.empty_tail = 0  # windows past the planned end sent in a row that came back empty
+        # Small jobs outrank backfills; preempted bulk jobs wait at a batch boundary
+        small = plan is None or plan.estimated_messages <= Config.INTERACTIVE_JOB_MESSAGES
+        self.priority = INTERACTIVE if small else BULK
+    
+    @classmethod
+    def from_state(cls, user_id, bot, state):
+        """Rebuild a job from its entry in the job state file"""
+        started_at = state['started_at']
+        if isinstance(started_at, str):
+            started_at = datetime.fromisoformat(started_at).timestamp()
+        job = cls(
+            user_id, bot, state['channels'], JobPlan.from_dict(state['plan']),
+            StatusMessage(bot, state['chat_id'], state['message_id']),
+            started_at, state.get('messages_forwarded', 0), state.get('next_window', 0),
+            state.get('retries', ())
+        )
+        job.empty_tail = state.get('empty_tail', 0)
+        return job
+    
+    def state(self):
+        """Entry for the job state file"""
+        return {
+            'channels': self.channels,
+            'chat_id': self.status_message.chat_id,
+            'message_id': self.status_message.message_id,
+            'plan': self.plan.to_dict(),
+            'started_at': self.started_at,
+            'messages_forwarded': self.messages_forwarded,
+            'next_window': self.next_window,
+            'retries': self.retries.snapshot(),
+            'empty_tail': self.empty_tail,
+            'status': self.status,
+        }
+    
+    def checkpoint(self, flush=True):
+        """Save the job's exact position (and, with it, today's quota usage)"""
+        job_manager.update_job(
+            self.user_id, flush=flush, messages_forwarded=self.messages_forwarded,
+            next_window=self.next_window, retries=self.retries.snapshot(), empty_tail=self.empty_tail,
+            plan=self.plan.to_dict()  # the engine moves the plan's end when it finds more messages
+        )
+        if flush:
+            scheduler.save()
+    
+    def window_to_send(self):
+        """Next window to send, or None when the source is done.
+
+        After the plan's windows the job keeps going past the planned end
+        until PROBE_EMPTY_WINDOWS windows in a row come back empty, so
+        messages the probes missed, or posted while the job ran, still go.
+        """
+        index = self.plan.next_window(self.next_window)
+        if index is None and self.plan.last_window is not None and self.empty_tail < Config.PROBE_EMPTY_WINDOWS:
+            index = max(self.next_window, self.plan.last_window + 1)
+        return index
+    
+    def has_work(self):
+        return self.window_to_send() is not None or len(self.retries) > 0
+    
+    def dead_letter_log(self):
+        if self.dead_letters is None:
+            self.dead_letters = DeadLetterLog(self.user_id, int(self.started_at))
+        return self.dead_letters
+    
+    def give_up(self, reason):
+        """Dead-letter every batch still waiting to retry, when the job can't go on"""
+        for first_id, count, _ in self.retries.snapshot():
+            self.dead_letter_log().add(range(first_id, first_id + count), reason)
+    
+    def failed_count(self):
+        return self.dead_letters.count if self.dead_letters is not None else 0
+    
+    def running_minutes(self):
+        return int(time.time() - self.started_at) // 60
+
+def same_channels(a, b):
+    """Whether two channel setups point at the same source and destination"""
+    return all(chat_ref(a[side]) == chat_ref(b[side]) for side in ('source', 'destination'))
+
+def id_runs(message_ids, attempt):
+    """Sorted ids as [first id, count, attempt] runs of up to BATCH_SIZE ids, for a RetryQueue"""
+    runs = []
+    for message_id in message_ids:
+        if runs and runs[-1][0] + runs[-1][1] == message_id and runs[-1][1] < Config.BATCH_SIZE:
+            runs[-1][1] += 1
+        else:
+            runs.append([message_id, 1, attempt])
+    return runs
+
 class ForwardHandlers:
     def __init__(self):
-        self.active_jobs = {}
-        self.forwarding_stats = {}
+        self.jobs = {}  # user_id -> ForwardJob, running or parked
+        self.active_jobs = {}  # user_id -> engine task, only while a burst is running
+        self.pending_plans = {}  # user_id -> (plan, channels) awaiting confirmation
+        self.planning = {}  # user_id -> task probing the source for a new plan
+        self.shutting_down = False
     
     async def start_forwarding(self, update, context):
-        """Start the 25msg/s forwarding engine"""
+        """Start planning a forwarding job; the plan is shown for confirmation when it is ready"""
         user_id = update.callback_query.from_user.id
         
         # Check if setup is complete
@@ -34,35 +174,188 @@ Then come back to start forwarding!"""
             await update.callback_query.edit_message_text(error_text, reply_markup=reply_markup, parse_mode='Markdown')
             return
         
+        if scheduler.draining:
+            drain_text = """
+🛠️ **MAINTENANCE IN PROGRESS**
+
+The bot is finishing running jobs and not accepting new ones right now.
+
+Please try again in a few minutes."""
+            
+            keyboard = [[InlineKeyboardButton("⬅️ BACK TO MAIN", callback_data="menu_main")]]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await update.callback_query.edit_message_text(drain_text, reply_markup=reply_markup, parse_mode='Markdown')
+            return
+        
+        if scheduler.quota_left(user_id) == 0:
+            await update.callback_query.answer("⚠️ Daily message quota reached!", show_alert=True)
+            return
+        
         # Start forwarding job
-        if user_id in self.active_jobs:
+        if user_id in self.jobs:
             await update.callback_query.answer("⚠️ Forwarding already running!", show_alert=True)
             return
         
+        # A paused job, or one stopped by the daily quota, continues where it left off
+        saved = job_manager.get_job(user_id)
+        if saved and saved.get('status') in RESUMABLE_STATUSES and same_channels(saved['channels'], user_channels):
+            await self.resume_saved_job(update, user_id, saved)
+            return
+        
+        if user_id in self.planning:
+            await update.callback_query.answer("⏳ Already planning this job", show_alert=True)
+            return
+        
+        # Probe the source's message id range before anything is forwarded
+        if not Config.PROBE_CHAT_ID:
+            keyboard = [[InlineKeyboardButton("⬅️ BACK TO MAIN", callback_data="menu_main")]]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await update.callback_query.edit_message_text(
+                "❌ **PLANNING FAILED**\n\n**Error:** no scratch chat for probes.\n\n"
+                "Ask the admin to set PROBE_CHAT_ID.",
+                reply_markup=reply_markup, parse_mode='Markdown'
+            )
+            return
+        await update.callback_query.edit_message_text(
+            "🔍 **PLANNING JOB...**\n\nMeasuring the source channel. Large channels can take a few "
+            "minutes; this message will show the plan when it's ready.",
+            parse_mode='Markdown'
+        )
+        
+        # Probes are paced like any send, so planning runs in the background
+        # instead of holding up this update
+        self.planning[user_id] = asyncio.create_task(self.plan_job(update.callback_query, user_id, user_channels))
+    
+    async def plan_job(self, query, user_id, user_channels):
+        """Probe the source, then show the plan for confirmation in the query's message"""
+        try:
+            planner = JobPlanner(bot_probe(
+                query.get_bot(), chat_ref(user_channels['source']), Config.PROBE_CHAT_ID, user_id
+            ))
+            try:
+                plan = await planner.plan()
+            except TelegramError as e:
+                logger.error(f"Planning failed for user {user_id}: {e}")
+                keyboard = [[InlineKeyboardButton("🔄 RETRY", callback_data="menu_start_forward")]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await query.edit_message_text(
+                    f"❌ **PLANNING FAILED**\n\n**Error:** {e}\n\nMake sure the bot can read the source channel.",
+                    reply_markup=reply_markup, parse_mode='Markdown'
+                )
+                return
+            
+            rate = scheduler.projected_rate(user_id, len(self.jobs))
+            plan_text = f"""
+📋 **FORWARDING PLAN**
+
+**Channels:**
+📤 Source: {user_channels['source'].get('title', 'Unknown')}
+🎯 Destination: {user_channels['destination'].get('title', 'Unknown')}
+
+📨 **Messages:** ~{plan.estimated_messages} (ids {plan.first_id}-{plan.last_id})
+📦 **Requests:** {plan.request_count} batches of up to {plan.window}
+⚡ **Expected Speed:** {rate:.1f} messages/second
+⏰ **Estimated Time:** {format_duration(plan.eta_seconds(rate))}
+🔍 **Probe Requests Used:** {plan.probe_requests}"""
+            
+            if plan.estimated_messages == 0:
+                keyboard = [[InlineKeyboardButton("⬅️ BACK TO MAIN", callback_data="menu_main")]]
+                plan_text += "\n\n❌ **No messages found in the source channel.**"
+            elif plan.estimated_messages > Config.MAX_MESSAGES_PER_JOB:
+                keyboard = [[InlineKeyboardButton("⬅️ BACK TO MAIN", callback_data="menu_main")]]
+                plan_text += f"\n\n❌ **Too large:** jobs are limited to {Config.MAX_MESSAGES_PER_JOB} messages."
+            else:
+                self.pending_plans[user_id] = (plan, user_channels)
+                keyboard = [
+                    [InlineKeyboardButton("✅ CONFIRM & START", callback_data="forward_confirm")],
+                    [InlineKeyboardButton("❌ CANCEL", callback_data="menu_main")]
+                ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            await query.edit_message_text(plan_text, reply_markup=reply_markup, parse_mode='Markdown')
+        except TelegramError as e:
+            logger.warning(f"Could not show the plan to user {user_id}: {e}")
+        finally:
+            self.planning.pop(user_id, None)
+    
+    async def resume_forwarding(self, update, context):
+        """Continue the user's paused (or quota-stopped) job from its checkpoint"""
+        user_id = update.callback_query.from_user.id
+        if user_id in self.jobs:
+            await update.callback_query.answer("⚠️ Forwarding already running!", show_alert=True)
+            return
+        if scheduler.draining:
+            await update.callback_query.answer("🛠️ Maintenance in progress, try again soon", show_alert=True)
+            return
+        if scheduler.quota_left(user_id) == 0:
+            await update.callback_query.answer("⚠️ Daily message quota reached!", show_alert=True)
+            return
+        saved = job_manager.get_job(user_id)
+        if not saved or saved.get('status') not in RESUMABLE_STATUSES:
+            await update.callback_query.answer("⚠️ Nothing to resume, start a new job", show_alert=True)
+            return
+        await self.resume_saved_job(update, user_id, saved)
+    
+    async def resume_saved_job(self, update, user_id, state):
+        """Restart a saved job from its checkpoint, reporting in the current message"""
+        job = ForwardJob.from_state(user_id, update.callback_query.get_bot(), state)
+        job.status_message = StatusMessage.from_query(update.callback_query)
+        self.jobs[user_id] = job
+        job_manager.save_job(user_id, job.state())
+        self.launch(job)
+        
+        resume_text = f"""
+▶️ **FORWARDING RESUMED**
+
+✅ **Already forwarded:** {job.messages_forwarded}/{job.plan.estimated_messages} messages
+
+**Status:** Continuing from where the job stopped..."""
+
+        keyboard = [
+            [InlineKeyboardButton("⏸️ PAUSE", callback_data="forward_pause"),
+             InlineKeyboardButton("🛑 STOP", callback_data="forward_stop")],
+            [InlineKeyboardButton("📊 LIVE STATS", callback_data="forward_stats")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.callback_query.edit_message_text(resume_text, reply_markup=reply_markup, parse_mode='Markdown')
+    
+    async def confirm_forwarding(self, update, context):
+        """Start the job the user just reviewed the plan for"""
+        user_id = update.callback_query.from_user.id
+        pending = self.pending_plans.pop(user_id, None)
+        
+        if pending is None:
+            await update.callback_query.answer("⚠️ Plan expired, please start again", show_alert=True)
+            return
+        if user_id in self.jobs:
+            await update.callback_query.answer("⚠️ Forwarding already running!", show_alert=True)
+            return
+        if scheduler.draining:
+            await update.callback_query.answer("🛠️ Maintenance in progress, try again soon", show_alert=True)
+            return
+        plan, user_channels = pending
+        
         # Start the forwarding task
-        task = asyncio.create_task(
-            self.forward_engine(user_id, user_channels, update.callback_query)
+        job = ForwardJob(
+            user_id, update.callback_query.get_bot(), user_channels, plan,
+            StatusMessage.from_query(update.callback_query)
         )
-        self.active_jobs[user_id] = task
-        self.forwarding_stats[user_id] = {
-            'started_at': datetime.now(),
-            'messages_forwarded': 0,
-            'status': 'running'
-        }
+        self.jobs[user_id] = job
+        job_manager.save_job(user_id, job.state())
+        self.launch(job)
         
         # Show starting message
         start_text = f"""
 🚀 **FORWARDING STARTED!**
 
-⚡ **MAXIMUM SPEED ACTIVATED: 25 messages/second**
-⏰ **Burst-Rest Cycle:** 5 minutes ON → 30 seconds OFF
+⚡ **MAXIMUM SPEED ACTIVATED: {scheduler.rate_for(user_id):g} messages/second**
+⏰ **Burst-Rest Cycle:** {Config.BURST_DURATION // 60} minutes ON → {Config.REST_DURATION} seconds OFF
 
 **Channels:**
 📤 Source: {user_channels['source'].get('title', 'Unknown')}
 🎯 Destination: {user_channels['destination'].get('title', 'Unknown')}
 
 **Status:** Starting engine...
-**Forwarded:** 0 messages
+**Forwarded:** 0/{plan.estimated_messages} messages
 
 🛡️ **Safety System:** ACTIVE
 🔧 **Auto-Recovery:** ENABLED"""
@@ -76,129 +369,501 @@ Then come back to start forwarding!"""
         
         await update.callback_query.edit_message_text(start_text, reply_markup=reply_markup, parse_mode='Markdown')
     
-    async def forward_engine(self, user_id, user_channels, query):
-        """The main forwarding engine with 25msg/s burst logic"""
+    # ==================== ENGINE ====================
+    def launch(self, job):
+        """Run one burst of a job's engine"""
+        self.active_jobs[job.user_id] = asyncio.create_task(self.forward_engine(job))
+    
+    def park(self, job, delay):
+        """Turn a job with nothing to do for `delay` seconds into plain data"""
+        self.active_jobs.pop(job.user_id, None)
+        scheduler.wake_later(job.user_id, delay, self.wake_job)
+    
+    def wake_job(self, user_id):
+        """Scheduler callback: start the next burst of a parked job"""
+        job = self.jobs.get(user_id)
+        if job is None or job.status != 'running' or user_id in self.active_jobs or self.shutting_down:
+            return
+        self.launch(job)
+    
+    def finish(self, job):
+        """Drop a job that ended (completed, failed, paused or stopped)"""
+        self.active_jobs.pop(job.user_id, None)
+        if self.jobs.get(job.user_id) is job:
+            del self.jobs[job.user_id]
+        scheduler.forget(job.user_id)
+        message_maps.release(job.source_id, job.destination_id)
+    
+    async def forward_engine(self, job):
+        """The forwarding engine: one burst of the burst-rest cycle.
+        
+        Sends the plan's windows in order, one forward_messages request per
+        window, and skips windows the planner already found empty. Batches
+        that hit a network error wait in a retry queue while later windows
+        keep going; messages that can't be sent go to the dead-letter log.
+        When the burst ends (or only retries that aren't due yet are left)
+        the job parks and the scheduler wakes it for the next burst.
+        """
+        user_id = job.user_id
+        plan = job.plan
+        keep = False  # the job lives on: parked, or cancelled by shutdown (which saves it)
         try:
-            bot = query.bot
-            total_messages = 1000  # Example - we'll get actual count later
-            forwarded = 0
+            total_messages = plan.estimated_messages
+            retries = job.retries
             
-            while forwarded < total_messages and self.forwarding_stats[user_id]['status'] == 'running':
-                # 🔥 BURST PHASE: 5 minutes at 25 msg/sec
-                burst_messages = min(7500, total_messages - forwarded)
-                burst_start_time = datetime.now()
+            keyboard = [
+                [InlineKeyboardButton("⏸️ PAUSE", callback_data="forward_pause"),
+                 InlineKeyboardButton("🛑 STOP", callback_data="forward_stop")],
+                [InlineKeyboardButton("📊 LIVE STATS", callback_data="forward_stats")]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if job.has_work() and job.status == 'running' and not self.shutting_down:
+                # 🔥 BURST PHASE
+                burst_start = loop_time()
+                speed = scheduler.rate_for(user_id)
                 
                 # Update status
                 status_text = f"""
 🚀 **FORWARDING IN PROGRESS...**
 
-⚡ **BURST MODE ACTIVE:** 25 messages/second
-⏰ **Burst Time:** 5 minutes
-📨 **This Burst:** {burst_messages} messages
+⚡ **BURST MODE ACTIVE:** {speed:g} messages/second
+⏰ **Burst Time:** {Config.BURST_DURATION // 60} minutes
 
-**Progress:** {forwarded}/{total_messages}
-**Speed:** 25 msg/sec
+**Progress:** {job.messages_forwarded}/{total_messages}
+**Speed:** {speed:g} msg/sec
+**Remaining:** ~{format_duration(plan.eta_seconds(speed, max(0, total_messages - job.messages_forwarded)))}
 **Status:** Running at maximum speed
 
-🛡️ **Next rest in:** 5 minutes"""
-                
-                keyboard = [
-                    [InlineKeyboardButton("⏸️ PAUSE", callback_data="forward_pause"),
-                     InlineKeyboardButton("🛑 STOP", callback_data="forward_stop")],
-                    [InlineKeyboardButton("📊 LIVE STATS", callback_data="forward_stats")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+🛡️ **Next rest in:** {Config.BURST_DURATION // 60} minutes"""
                 
-                await query.edit_message_text(status_text, reply_markup=reply_markup, parse_mode='Markdown')
+                await self.show(job, status_text, reply_markup)
                 
-                # Simulate forwarding (replace with actual message fetching)
-                for i in range(burst_messages):
-                    if self.forwarding_stats[user_id]['status'] != 'running':
+                while loop_time() - burst_start < Config.BURST_DURATION:
+                    # Shutdown stops here, between sends, so the count is always exact
+                    if job.status != 'running' or self.shutting_down:
                         break
                     
-                    # Simulate message forwarding
-                    # await bot.forward_message(
-                    #     chat_id=user_channels['destination']['id'],
-                    #     from_chat_id=user_channels['source']['id'],
-                    #     message_id=message_id
-                    # )
+                    # Retries that are due go first, otherwise the next window
+                    retry = retries.pop_due()
+                    index = job.window_to_send() if retry is None else None
+                    if retry is not None:
+                        ids, attempt = retry
+                        count = await self.forward_batch(job, ids, attempt)
+                    elif index is not None and index <= plan.last_window:
+                        count = await self.forward_batch(job, plan.window_ids(index), expected=plan.window_count(index))
+                        job.next_window = index + 1
+                    elif index is not None:
+                        # Past the planned end the probe counts are stale; a window
+                        # only counts as empty if nothing was sent, queued or failed
+                        before = (len(retries), job.failed_count())
+                        count = await self.forward_batch(job, plan.window_ids(index))
+                        if count:
+                            plan.last_window = index
+                            plan.estimated_messages += count
+                        empty = not count and before == (len(retries), job.failed_count())
+                        job.empty_tail = job.empty_tail + 1 if empty else 0
+                        job.next_window = index + 1
+                    elif retries:
+                        # Only retries left, none due yet: park until the first one is
+                        self.park(job, retries.next_due_in())
+                        keep = True
+                        return
+                    else:
+                        break
                     
-                    await asyncio.sleep(0.04)  # 25 msg/second
-                    forwarded += 1
-                    self.forwarding_stats[user_id]['messages_forwarded'] = forwarded
+                    previous = job.messages_forwarded
+                    job.messages_forwarded += count
+                    analytics.record_forwarded(user_id, job.destination_id, count)
+                    if job.quota_reached:
+                        job.status = 'quota_reached'
+                        break
                     
-                    # Update progress every 100 messages
-                    if forwarded % 100 == 0:
+                    # Update progress every PROGRESS_UPDATE_INTERVAL messages
+                    if job.messages_forwarded // Config.PROGRESS_UPDATE_INTERVAL != previous // Config.PROGRESS_UPDATE_INTERVAL:
+                        job.checkpoint()
                         progress_text = f"""
 📊 **PROGRESS UPDATE**
 
-✅ **Forwarded:** {forwarded}/{total_messages}
-⚡ **Current Speed:** 25 messages/second  
-⏰ **Running Time:** {(datetime.now() - self.forwarding_stats[user_id]['started_at']).seconds // 60} minutes
+✅ **Forwarded:** {job.messages_forwarded}/{total_messages}
+⚡ **Current Speed:** {analytics.live_rate(user_id):.1f} messages/second  
+⏰ **Running Time:** {job.running_minutes()} minutes
+🔁 **Waiting to retry:** {len(retries)} batches
+⚠️ **Failed:** {job.failed_count()} messages
 
-**Status:** Burst mode active - {7500 - (i + 1)} messages left in this burst"""
+**Status:** Burst mode active - {format_duration(Config.BURST_DURATION - (loop_time() - burst_start))} left in this burst"""
                         
-                        await query.edit_message_text(progress_text, reply_markup=reply_markup, parse_mode='Markdown')
-                
-                # 😴 REST PHASE: 30 seconds (if more messages remain)
-                if forwarded < total_messages and self.forwarding_stats[user_id]['status'] == 'running':
-                    rest_text = f"""
+                        await self.show(job, progress_text, reply_markup)
+            
+            forwarded = job.messages_forwarded
+            if self.shutting_down and job.status == 'running' and job.has_work():
+                keep = True
+                await self.checkpoint_for_restart(job)
+                return
+            
+            # 😴 REST PHASE (if more messages remain): park instead of sleeping
+            if job.status == 'running' and job.has_work():
+                rest_text = f"""
 😴 **REST PHASE**
 
-⏰ **Taking 30-second break...**
+⏰ **Taking {Config.REST_DURATION}-second break...**
 ✅ **Completed:** {forwarded}/{total_messages} messages
-⚡ **Next burst in:** 30 seconds
+⚡ **Next burst in:** {Config.REST_DURATION} seconds
 
 **Reason:** Safety cooldown to prevent Telegram limits
 **Status:** Auto-resuming shortly..."""
 
-                    await query.edit_message_text(rest_text, reply_markup=reply_markup, parse_mode='Markdown')
-                    await asyncio.sleep(30)  # 30 second rest
+                await self.show(job, rest_text, reply_markup)
+                self.park(job, Config.REST_DURATION)
+                keep = True
+                return
+            
+            if job.status == 'quota_reached':
+                # Keep the exact position so the next start continues from here
+                job.checkpoint(flush=False)
+                job_manager.update_job(user_id, status='quota_reached')
+                quota_text = f"""
+⚠️ **DAILY QUOTA REACHED**
+
+✅ **Forwarded:** {forwarded}/{total_messages}
+
+Your daily message quota is used up. Press START FORWARDING tomorrow to continue from this point."""
+
+                keyboard = [[InlineKeyboardButton("⬅️ BACK TO MAIN", callback_data="menu_main")]]
+                reply_markup = InlineKeyboardMarkup(keyboard)
+                await self.show(job, quota_text, reply_markup)
             
             # Completion
-            if forwarded >= total_messages:
+            failed = 0
+            if not job.has_work():
+                elapsed = max(1, int(time.time() - job.started_at))
+                failed = job.dead_letter_log().count
                 completion_text = f"""
 🎉 **FORWARDING COMPLETED!**
 
 ✅ **Successfully forwarded:** {forwarded} messages
-⚡ **Average Speed:** 25 messages/second
-⏰ **Total Time:** {(datetime.now() - self.forwarding_stats[user_id]['started_at']).seconds // 60} minutes
-
-**Status:** All messages transferred successfully!"""
+⚡ **Average Speed:** {forwarded / elapsed:.1f} messages/second
+⏰ **Total Time:** {elapsed // 60} minutes"""
 
                 keyboard = [[InlineKeyboardButton("🔄 START NEW", callback_data="menu_start_forward")]]
+                if failed:
+                    completion_text += f"""
+⚠️ **Could not forward:** {failed} messages
+
+Export the list, or retry them once the problem is fixed."""
+                    keyboard.insert(0, [
+                        InlineKeyboardButton("📄 EXPORT FAILED", callback_data="forward_failed_export"),
+                        InlineKeyboardButton("🔁 RETRY FAILED", callback_data="forward_failed_replay")
+                    ])
+                else:
+                    completion_text += "\n\n**Status:** All messages transferred successfully!"
                 reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(completion_text, reply_markup=reply_markup, parse_mode='Markdown')
+                await self.show(job, completion_text, reply_markup)
             
-            # Cleanup
-            if user_id in self.active_jobs:
-                del self.active_jobs[user_id]
-                
+            analytics.record_job(user_id, job.destination_id, job.started_at, forwarded, failed)
+        
+        except asyncio.CancelledError:
+            keep = True
+            raise
         except Exception as e:
             logger.error(f"Forwarding error for user {user_id}: {e}")
+            analytics.record_error(user_id, job.destination_id)
+            job.give_up(f"Job stopped: {e}")
             error_text = f"""
 ❌ **FORWARDING ERROR**
 
 An error occurred during forwarding:
 
 **Error:** {str(e)}
-**Messages Forwarded:** {self.forwarding_stats.get(user_id, {}).get('messages_forwarded', 0)}
+**Messages Forwarded:** {job.messages_forwarded}
 
 **Auto-recovery failed.** Please check channel permissions and try again."""
 
             keyboard = [[InlineKeyboardButton("🔄 RETRY", callback_data="menu_start_forward")]]
             reply_markup = InlineKeyboardMarkup(keyboard)
-            await query.edit_message_text(error_text, reply_markup=reply_markup, parse_mode='Markdown')
+            await self.show(job, error_text, reply_markup)
+        
+        finally:
+            # Cleanup: a job that ended (completed, failed, paused, stopped or
+            # out of quota) is dropped; only a completed or failed one is forgotten
+            if not keep:
+                self.finish(job)
+                if job.status == 'running':
+                    job_manager.remove_job(user_id)
+    
+    async def show(self, job, text, reply_markup=None):
+        """Edit a job's status message; a failed edit never stops the job"""
+        try:
+            await job.status_message.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        except TelegramError as e:
+            logger.warning(f"Could not update status for user {job.user_id}: {e}")
+    
+    async def deliver(self, job, ids, attempt=0, expected=None):
+        """Forward one batch of ids, routing failures by error class.
+        
+        Returns how many messages were forwarded. Slots are reserved for
+        every id unless the planner probed the window (`expected`), so an
+        unprobed window can never overshoot the rate cap or the quota; slots
+        that end up unused are refunded. Network errors queue the batch for
+        a later retry, RetryAfter pauses the scheduler and tries again, and a
+        batch Telegram rejects is re-sent one message at a time so only the
+        messages at fault are dead-lettered. Job-level errors (missing
+        rights, unknown chat) are raised.
+        """
+        while True:
+            reserve = len(ids) if expected is None else min(expected, len(ids))
+            granted = await scheduler.acquire(job.user_id, reserve, job.priority)
+            if granted == 0:
+                # Shutdown or quota: nothing was sent, keep the ids for the next run
+                job.quota_reached = not scheduler.closed
+                job.retries.push(ids, attempt, delay=0)
+                return 0
+            if granted < reserve:
+                # Quota left for part of the batch: send that many ids, keep the rest
+                job.retries.push(ids[granted:], attempt, delay=0)
+                ids = ids[:granted]
+            try:
+                sent = await job.bot.forward_messages(
+                    chat_id=job.destination, from_chat_id=job.source, message_ids=list(ids)
+                )
+            except TelegramError as e:
+                scheduler.refund(job.user_id, granted)
+                kind = classify_error(e)
+                if kind == RATE_LIMITED:
+                    seconds = retry_after_seconds(e)
+                    scheduler.pause_for(seconds)
+                    analytics.record_throttle(job.user_id, job.destination_id, seconds)
+                    continue
+                if kind == SKIP:
+                    return 0
+                if kind == FATAL:
+                    # Kept with the retries so the job's error handling can dead-letter it
+                    job.retries.push(ids, attempt, delay=0)
+                    raise
+                
+                analytics.record_error(job.user_id, job.destination_id)
+                if kind == RETRYABLE:
+                    if attempt < Config.MAX_RETRIES:
+                        job.retries.push(ids, attempt + 1)
+                    else:
+                        job.dead_letter_log().add(ids, f"Gave up after {attempt} retries: {e}")
+                    return 0
+                
+                # PERMANENT
+                if len(ids) == 1:
+                    job.dead_letter_log().add(ids, str(e))
+                    return 0
+                return await self.deliver_singly(job, ids, attempt)
             
-            if user_id in self.active_jobs:
-                del self.active_jobs[user_id]
+            scheduler.refund(job.user_id, granted - len(sent))
+            self.record_mapping(job, ids, sent)
+            return len(sent)
+    
+    async def forward_batch(self, job, ids, attempt=0, expected=None):
+        """Forward a window or a retried batch.
+        
+        Only a batch whose ids all exist can be mapped (see record_mapping).
+        By default a window that turns out to have gaps simply goes unmapped;
+        with MAP_PARTIAL_BATCHES, windows the planner didn't find full go out
+        one id per request instead so every message is mapped. The rate cap
+        counts messages, so that adds requests (up to one per message, which
+        the plan's request count doesn't show) but no more messages.
+        """
+        if Config.MAP_PARTIAL_BATCHES and len(ids) > 1 and expected != len(ids):
+            return await self.deliver_singly(job, ids, attempt)
+        return await self.deliver(job, ids, attempt, expected)
+    
+    async def deliver_singly(self, job, ids, attempt):
+        """Forward ids one request each; ids left when the job must stop go back to the retries"""
+        forwarded = 0
+        for position, message_id in enumerate(ids):
+            try:
+                forwarded += await self.deliver(job, [message_id], attempt)
+            except TelegramError:
+                if ids[position + 1:]:
+                    job.retries.push(ids[position + 1:], attempt, delay=0)
+                raise
+            if job.quota_reached or scheduler.closed:
+                if ids[position + 1:]:
+                    job.retries.push(ids[position + 1:], attempt, delay=0)
+                break
+        return forwarded
+    
+    def record_mapping(self, job, ids, sent):
+        """Remember which destination message each source message became.
+        
+        Telegram returns the new ids in source order but silently leaves out
+        source ids that don't exist, so a batch can only be mapped when every
+        id in it was sent; forward_batch sends batches that may not be full
+        one id at a time for this reason.
+        """
+        if len(sent) != len(ids) or job.source_id is None or job.destination_id is None:
+            return
+        message_maps.get(job.source_id, job.destination_id).add(
+            zip(ids, (message.message_id for message in sent))
+        )
+    
+    async def export_failed(self, update, context):
+        """Send the user the dead-letter log of their last job"""
+        user_id = update.callback_query.from_user.id
+        log = DeadLetterLog.latest(user_id)
+        if log is None or not log.count:
+            await update.callback_query.answer("✅ No failed messages", show_alert=True)
+            return
+        with open(log.file, 'rb') as f:
+            await update.callback_query.message.reply_document(
+                document=f, filename=f"failed-messages-{log.job_id}.jsonl",
+                caption=f"⚠️ {log.count} messages could not be forwarded"
+            )
+    
+    async def replay_failed(self, update, context):
+        """Retry the dead-lettered messages of the user's last job as a new job.
+        
+        The failed ids become the new job's retry queue and the old log is
+        deleted once the job is saved, so the replay can be paused, stopped
+        and resumed like any job, and whatever fails again is logged once,
+        in the new job's log.
+        """
+        user_id = update.callback_query.from_user.id
+        log = DeadLetterLog.latest(user_id)
+        if log is None or not log.count:
+            await update.callback_query.answer("✅ No failed messages", show_alert=True)
+            return
+        if user_id in self.jobs:
+            await update.callback_query.answer("⚠️ Forwarding already running!", show_alert=True)
+            return
+        if scheduler.draining or self.shutting_down:
+            await update.callback_query.answer("🛠️ Maintenance in progress, try again soon", show_alert=True)
+            return
+        
+        from handlers.setup_handlers import setup_handler
+        user_channels = await setup_handler.get_user_channels(user_id)
+        if not await setup_handler.is_setup_complete(user_id):
+            await update.callback_query.answer("⚙️ Set up both channels first", show_alert=True)
+            return
+        
+        # Each id already had every attempt, so a network error dead-letters it again
+        message_ids = sorted({entry['message_id'] for entry in log.entries()})
+        job = ForwardJob(
+            user_id, update.callback_query.get_bot(), user_channels,
+            JobPlan(None, estimated_messages=len(message_ids)),
+            StatusMessage.from_query(update.callback_query),
+            retry_items=id_runs(message_ids, Config.MAX_RETRIES)
+        )
+        self.jobs[user_id] = job
+        job_manager.save_job(user_id, job.state())
+        log.remove(message_ids)
+        self.launch(job)
+        
+        keyboard = [
+            [InlineKeyboardButton("⏸️ PAUSE", callback_data="forward_pause"),
+             InlineKeyboardButton("🛑 STOP", callback_data="forward_stop")],
+            [InlineKeyboardButton("📊 LIVE STATS", callback_data="forward_stats")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        await update.callback_query.edit_message_text(
+            f"🔁 **RETRYING FAILED MESSAGES**\n\n📨 **Messages:** {len(message_ids)}\n\n**Status:** Starting engine...",
+            reply_markup=reply_markup, parse_mode='Markdown'
+        )
+    
+    async def checkpoint_for_restart(self, job):
+        """Save the exact position of a job interrupted by shutdown and tell the user"""
+        job.checkpoint()
+        self.finish(job)
+        
+        restart_text = f"""
+🔄 **BOT RESTARTING**
+
+✅ **Progress saved:** {job.messages_forwarded}/{job.plan.estimated_messages} messages
+
+Forwarding will resume automatically from this point in a moment."""
+        
+        try:
+            await job.status_message.edit_message_text(restart_text, parse_mode='Markdown')
+        except Exception as e:
+            logger.warning(f"Could not post restart notice for user {job.user_id}: {e}")
+    
+    async def shutdown(self, grace_period):
+        """Stop every engine at a message boundary and checkpoint it.
+        
+        Engines get `grace_period` seconds to finish their in-flight send and
+        save their position; any still running after that are cancelled and
+        checkpointed at their last counted message. Parked jobs are already
+        at a clean position and are simply saved.
+        """
+        self.shutting_down = True
+        # Engines waiting for a send slot (e.g. out a RetryAfter pause) give up
+        # now, so nothing new is sent that the grace period could cut off
+        scheduler.close()
+        for task in self.planning.values():
+            task.cancel()
+        await asyncio.gather(*self.planning.values(), return_exceptions=True)
+        
+        tasks = dict(self.active_jobs)
+        if tasks:
+            logger.info(f"Waiting up to {grace_period}s for {len(tasks)} forwarding jobs to checkpoint")
+            done, pending = await asyncio.wait(tasks.values(), timeout=grace_period)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for user_id, task in tasks.items():
+                if task in pending:
+                    logger.warning(f"Job of user {user_id} cancelled after grace period")
+        
+        # Whatever is left (parked or cancelled) is checkpointed in one write
+        for job in self.jobs.values():
+            if job.status == 'running':
+                job.checkpoint(flush=False)
+        job_manager.flush()
+        self.active_jobs.clear()
+        self.jobs.clear()
+    
+    async def resume_jobs(self, bot):
+        """Restart jobs that were running when the previous process exited"""
+        for user_id, state in job_manager.resumable_jobs().items():
+            if user_id in self.jobs:
+                continue
+            
+            job = ForwardJob.from_state(user_id, bot, state)
+            self.jobs[user_id] = job
+            self.launch(job)
+            logger.info(f"Resumed forwarding for user {user_id} at message {job.messages_forwarded}")
+    
+    def running_jobs(self):
+        """Every running or parked job, for the admin view"""
+        return dict(self.jobs)
+    
+    def pause_job(self, user_id):
+        """Ask a job's engine to stop at the next message, keeping its state"""
+        job = self.jobs.get(user_id)
+        if job is not None:
+            job.status = 'paused'
+            job.checkpoint(flush=False)
+            job_manager.update_job(user_id, status='paused')
+            if user_id not in self.active_jobs:
+                # Parked: nothing will run again, so finish it here
+                self.finish(job)
+        return job
+    
+    def stop_job(self, user_id):
+        """Cancel a job and forget its persisted state"""
+        job = self.jobs.get(user_id)
+        if job is not None:
+            job.status = 'stopped'
+        job_manager.remove_job(user_id)
+        
+        # Cancel the task
+        if user_id in self.active_jobs:
+            self.active_jobs[user_id].cancel()
+        if job is not None:
+            self.finish(job)
+        scheduler.forget(user_id)
+        return job
     
     async def pause_forwarding(self, update, context):
         """Pause active forwarding"""
         user_id = update.callback_query.from_user.id
-        
-        if user_id in self.forwarding_stats:
-            self.forwarding_stats[user_id]['status'] = 'paused'
+        job = self.pause_job(user_id)
             
         pause_text = """
 ⏸️ **FORWARDING PAUSED**
@@ -207,7 +872,7 @@ An error occurred during forwarding:
 **Messages Forwarded:** {count} messages
 
 Use buttons below to resume or stop.""".format(
-    count=self.forwarding_stats.get(user_id, {}).get('messages_forwarded', 0)
+    count=job.messages_forwarded if job else 0
 )
 
         keyboard = [
@@ -222,14 +887,7 @@ Use buttons below to resume or stop.""".format(
     async def stop_forwarding(self, update, context):
         """Stop active forwarding"""
         user_id = update.callback_query.from_user.id
-        
-        if user_id in self.forwarding_stats:
-            self.forwarding_stats[user_id]['status'] = 'stopped'
-        
-        # Cancel the task
-        if user_id in self.active_jobs:
-            self.active_jobs[user_id].cancel()
-            del self.active_jobs[user_id]
+        job = self.stop_job(user_id)
         
         stop_text = """
 🛑 **FORWARDING STOPPED**
@@ -238,7 +896,7 @@ Use buttons below to resume or stop.""".format(
 **Final Count:** {count} messages forwarded
 
 Use the main menu to start a new forwarding job.""".format(
-    count=self.forwarding_stats.get(user_id, {}).get('messages_forwarded', 0)
+    count=job.messages_forwarded if job else 0
 )
 
         keyboard = [[InlineKeyboardButton("🚀 START NEW", callback_data="menu_main")]]
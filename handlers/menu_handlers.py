@@ -4,8 +4,14 @@ import logging
 logger = logging.getLogger(__name__)
 
 class MenuHandlers:
-    def __init__(self):
-        self.setup_menus()
+    MENUS = ('main_menu', 'source_setup_menu', 'dest_setup_menu', 'forward_control_menu', 'status_menu')
+    
+    def __getattr__(self, name):
+        # Keyboards are built on first use rather than at import, to keep startup fast
+        if name in self.MENUS:
+            self.setup_menus()
+            return self.__dict__[name]
+        raise AttributeError(name)
     
     def setup_menus(self):
         """Create all menu keyboards"""
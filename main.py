@@ -1,39 +1,52 @@
-from flask import Flask
-from threading import Thread
-import os
-import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from __future__ import annotations
 
-# Import handlers
-from handlers.menu_handlers import menu_handler
-from handlers.setup_handlers import setup_handler
-from handlers.forward_handlers import forward_handler
-from config import Config
+import time
+START_TIME = time.perf_counter()
 
-# ==================== HEALTH CHECK SERVER ====================
-app = Flask('')
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import TYPE_CHECKING
 
-@app.route('/')
-def home():
-    return "🤖 Bot is running"
+from config import Config
 
-@app.route('/health')
-def health():
-    return {"status": "healthy"}, 200
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import ContextTypes
 
-def run_flask():
-    app.run(host='0.0.0.0', port=8080, debug=False)
+# ==================== HEALTH CHECK SERVER ====================
+# Plain http.server instead of Flask: it needs no extra imports, so /health
+# answers within milliseconds of process start, before the bot has loaded.
+class HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_body(200, 'application/json', json.dumps({"status": "healthy"}))
+        elif self.path == '/':
+            self.send_body(200, 'text/plain; charset=utf-8', "🤖 Bot is running")
+        else:
+            self.send_body(404, 'text/plain; charset=utf-8', "Not found")
+    
+    def send_body(self, status, content_type, body):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        """Keep health probes out of the logs"""
 
 def keep_alive():
-    server = Thread(target=run_flask, daemon=True)
-    server.start()
-    print("✅ Health check server started")
-
-# Start health check server
-keep_alive()
+    server = ThreadingHTTPServer(('0.0.0.0', Config.HEALTH_PORT), HealthHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"✅ Health check server started in {(time.perf_counter() - START_TIME) * 1000:.1f} ms")
+    return server
 
 # ==================== BOT SETUP ====================
+# Telegram and the handler modules are imported inside FastForwardBot, after
+# the health server is already answering.
 logging.basicConfig(
     format=Config.LOG_FORMAT,
     level=getattr(logging, Config.LOG_LEVEL)
@@ -41,26 +54,66 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class FastForwardBot:
-    def __init__(self):
+    def __init__(self, request=None):
         self.token = Config.BOT_TOKEN
         if not self.token:
             raise ValueError("BOT_TOKEN not found")
         
-        self.application = Application.builder().token(self.token).build()
+        from telegram.ext import Application
+        from utils.update_processor import PerUserUpdateProcessor
+        from handlers.menu_handlers import menu_handler
+        from handlers.setup_handlers import setup_handler
+        from handlers.forward_handlers import forward_handler
+        from handlers.admin_handlers import admin_handler
+        self.admin_handler = admin_handler
+        self.menu_handler = menu_handler
+        self.setup_handler = setup_handler
+        self.forward_handler = forward_handler
+        self.first_update_ms = None
+        self.background_tasks = []
+        
+        # Different users are handled in parallel, each user's updates in order
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(PerUserUpdateProcessor(Config.MAX_CONCURRENT_UPDATES))
+            .post_init(self.post_init)
+            .post_stop(self.post_stop)
+        )
+        if request is not None:
+            # Alternative transport, e.g. the fake Bot API used by the benchmarks
+            builder = builder.request(request).get_updates_request(request)
+        self.application = builder.build()
         self.setup_handlers()
     
     def setup_handlers(self):
         """Setup all command and message handlers"""
+        from telegram import Update
+        from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters
+        
+        # Startup timing (runs before every other handler)
+        self.application.add_handler(TypeHandler(Update, self.mark_first_update), group=-1)
+        
         # Command handlers
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("help", self.help_command))
         self.application.add_handler(CommandHandler("status", self.status_command))
         
+        # Admin commands (checked against Config.ADMIN_IDS)
+        self.application.add_handler(CommandHandler("admin", self.admin_handler.admin_command))
+        self.application.add_handler(CommandHandler("setrate", self.admin_handler.set_rate_command))
+        self.application.add_handler(CommandHandler("setuserrate", self.admin_handler.set_user_rate_command))
+        self.application.add_handler(CommandHandler("setquota", self.admin_handler.set_quota_command))
+        self.application.add_handler(CommandHandler("pausejob", self.admin_handler.pause_job_command))
+        self.application.add_handler(CommandHandler("killjob", self.admin_handler.kill_job_command))
+        self.application.add_handler(CommandHandler("drain", self.admin_handler.drain_command))
+        
         # Button click handlers
         self.application.add_handler(CallbackQueryHandler(self.main_menu_click, pattern="^menu_"))
         self.application.add_handler(CallbackQueryHandler(self.forwarding_click, pattern="^forward_"))
         self.application.add_handler(CallbackQueryHandler(self.source_setup_click, pattern="^source_"))
         self.application.add_handler(CallbackQueryHandler(self.dest_setup_click, pattern="^dest_"))
+        self.application.add_handler(CallbackQueryHandler(self.admin_handler.admin_click, pattern="^admin_"))
         
         # Message handlers
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
@@ -69,9 +122,51 @@ class FastForwardBot:
         # Error handler
         self.application.add_error_handler(self.error_handler)
     
+    async def post_init(self, application):
+        """Resume persisted jobs in the background once the bot is connected"""
+        import asyncio
+        from database.analytics import analytics
+        from utils.scheduler import scheduler
+        scheduler.load()
+        # The application isn't running yet, so these are plain tasks we own
+        self.background_tasks = [
+            asyncio.create_task(self.forward_handler.resume_jobs(application.bot)),
+            asyncio.create_task(analytics.run_rollups()),
+        ]
+        print(f"✅ Bot initialized in {(time.perf_counter() - START_TIME) * 1000:.0f} ms")
+    
+    async def post_stop(self, application):
+        """Shutdown coordinator, run on SIGTERM/SIGINT once polling has stopped.
+        
+        Stops accepting jobs, lets engines finish their in-flight send within
+        SHUTDOWN_GRACE_PERIOD, and persists exact positions so the next
+        process resumes with no gap or duplicate.
+        """
+        import asyncio
+        from database.analytics import analytics
+        from database.message_map import message_maps
+        from utils.scheduler import scheduler
+        scheduler.set_draining(True, save=False)
+        await self.forward_handler.shutdown(Config.SHUTDOWN_GRACE_PERIOD)
+        for task in self.background_tasks:
+            task.cancel()
+        await asyncio.gather(*self.background_tasks, return_exceptions=True)
+        scheduler.save()
+        analytics.tick()
+        analytics.flush()
+        message_maps.close()
+        print("✅ Shutdown complete, job state saved")
+    
+    async def mark_first_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Log time-to-first-update once, as a cold start metric"""
+        if self.first_update_ms is None:
+            self.first_update_ms = (time.perf_counter() - START_TIME) * 1000
+            logger.info(f"Startup metric: first update after {self.first_update_ms:.0f} ms")
+    
     # ==================== COMMAND HANDLERS ====================
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Simple start command"""
+        from telegram import InlineKeyboardButton, InlineKeyboardMarkup
         try:
             welcome_text = "Channel Forward Bot\n\nI help you move messages between channels quickly and safely."
             
@@ -105,14 +200,23 @@ I'll move messages automatically at optimal speed."""
     
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Simple status command"""
+        from database.analytics import analytics
+        from utils.scheduler import scheduler
+        totals = analytics.user_totals(update.effective_user.id)
         status_text = f"""
 System Status:
 
 ✅ Bot: Running
-⚡ Speed: {Config.MAX_SPEED} msg/sec
+⚡ Speed: {scheduler.global_rate} msg/sec
 🔄 Mode: Smart forwarding
 📊 Ready: Yes
 
+Your History:
+📨 Forwarded: {totals['forwarded']} messages
+🚀 Peak Rate: {totals['peak_rate']} msg/sec
+⚠️ Errors: {totals['errors']}
+🐢 Throttled: {totals['throttle_minutes']} minutes
+
 Use /start to begin."""
         
         await update.message.reply_text(status_text)
@@ -127,13 +231,13 @@ Use /start to begin."""
         
         try:
             if data == "menu_main":
-                await menu_handler.show_main_menu(update, context)
+                await self.menu_handler.show_main_menu(update, context)
             elif data == "menu_setup_source":
-                await menu_handler.show_source_setup(update, context)
+                await self.menu_handler.show_source_setup(update, context)
             elif data == "menu_setup_dest":
-                await menu_handler.show_dest_setup(update, context)
+                await self.menu_handler.show_dest_setup(update, context)
             elif data == "menu_start_forward":
-                await forward_handler.start_forwarding(update, context)
+                await self.forward_handler.start_forwarding(update, context)
             elif data == "menu_status":
                 await self.status_command(update, context)
             elif data == "menu_help":
@@ -151,15 +255,21 @@ Use /start to begin."""
         
         try:
             if data == "forward_start":
-                await forward_handler.start_forwarding(update, context)
+                await self.forward_handler.start_forwarding(update, context)
+            elif data == "forward_confirm":
+                await self.forward_handler.confirm_forwarding(update, context)
+            elif data == "forward_failed_export":
+                await self.forward_handler.export_failed(update, context)
+            elif data == "forward_failed_replay":
+                await self.forward_handler.replay_failed(update, context)
             elif data == "forward_pause":
-                await forward_handler.pause_forwarding(update, context)
+                await self.forward_handler.pause_forwarding(update, context)
             elif data == "forward_stop":
-                await forward_handler.stop_forwarding(update, context)
+                await self.forward_handler.stop_forwarding(update, context)
             elif data == "forward_stats":
                 await query.answer("Status: Ready")
             elif data == "forward_resume":
-                await query.answer("Ready to resume")
+                await self.forward_handler.resume_forwarding(update, context)
         except Exception as e:
             logger.error(f"Forward error: {e}")
             await query.answer("Action failed")
@@ -202,7 +312,7 @@ Use /start to begin."""
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages"""
         try:
-            await setup_handler.handle_channel_link(update, context)
+            await self.setup_handler.handle_channel_link(update, context)
         except Exception as e:
             logger.error(f"Message error: {e}")
             await update.message.reply_text("Could not process message")
@@ -211,12 +321,12 @@ Use /start to begin."""
         """Handle forwarded messages"""
         try:
             user_id = update.message.from_user.id
-            user_channels = await setup_handler.get_user_channels(user_id)
+            user_channels = await self.setup_handler.get_user_channels(user_id)
             
             if 'source' not in user_channels:
-                await setup_handler.handle_source_forward(update, context)
+                await self.setup_handler.handle_source_forward(update, context)
             elif 'destination' not in user_channels:
-                await setup_handler.handle_dest_forward(update, context)
+                await self.setup_handler.handle_dest_forward(update, context)
             else:
                 await update.message.reply_text("Channels set. Use /start to begin forwarding.")
         except Exception as e:
@@ -234,6 +344,7 @@ Use /start to begin."""
 
 # ==================== MAIN EXECUTION ====================
 if __name__ == "__main__":
+    keep_alive()
     try:
         if Config.validate_config():
             bot = FastForwardBot()
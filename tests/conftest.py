@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from database.analytics import analytics
+from database.job_manager import job_manager
+from database.message_map import message_maps
+from handlers.forward_handlers import forward_handler
+from handlers.setup_handlers import setup_handler
+from tests.fake_telegram import FakeTelegram
+from utils.scheduler import scheduler
+
+SOURCE = -100
+DESTINATION = -200
+CHANNELS = {
+    'source': {'id': SOURCE, 'title': 'Source', 'username': None},
+    'destination': {'id': DESTINATION, 'title': 'Destination', 'username': None},
+}
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Fresh global singletons with all their files under tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'DEAD_LETTER_DIR', str(tmp_path / 'dead_letters'))
+    message_maps.close()
+    message_maps.__init__(str(tmp_path / 'message_maps'))
+    job_manager.__init__(str(tmp_path / 'jobs_state.json'))
+    scheduler.__init__(path=str(tmp_path / 'scheduler_state.json'))
+    analytics.__init__(str(tmp_path / 'analytics'))
+    forward_handler.__init__()
+    setup_handler.user_channels = {}
+    yield
+    message_maps.close()
+
+async def make_bot(fake):
+    """A real telegram.Bot talking to the fake API"""
+    from telegram import Bot
+    bot = Bot('1:fake', request=fake, get_updates_request=fake)
+    await bot.initialize()
+    return bot
+
+def click(fake, bot, user_id, data):
+    """A callback query Update as the bot would receive it"""
+    from telegram import Update
+    fake.click(user_id, data)
+    return Update.de_json(fake.updates.pop(), bot)
+
+async def wait_for_jobs(timeout=10 ** 6):
+    """Wait (in loop time) until no job is running or parked"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while forward_handler.jobs and loop.time() < deadline:
+        await asyncio.sleep(1)
+
+def full_channel(last_id, gaps=()):
+    return FakeTelegram({SOURCE: set(range(1, last_id + 1)) - set(gaps)})
@@ -0,0 +1,46 @@
+"""Run the real bot (main.FastForwardBot) against the fake Bot API.
+
+Used by test_shutdown.py as a separate process it can SIGTERM. Run from a
+working directory holding jobs_state.json; every forwarded message is
+appended to sent.log there.
+
+    python -m tests.fake_bot_process --last-id 300 [--retry-after-call N --retry-after S]
+                                     [--slow-response-call N --slow-response S] [--grace S]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.fake_telegram import FakeTelegram, retry_after
+
+SOURCE = -100
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--last-id', type=int, required=True)
+    parser.add_argument('--retry-after-call', type=int, default=0)
+    parser.add_argument('--retry-after', type=int, default=0)
+    parser.add_argument('--slow-response-call', type=int, default=0)
+    parser.add_argument('--slow-response', type=float, default=0)
+    parser.add_argument('--grace', type=float, default=None)
+    args = parser.parse_args()
+
+    from config import Config
+    import main as bot_main
+    if args.grace is not None:
+        Config.SHUTDOWN_GRACE_PERIOD = args.grace
+
+    fake = FakeTelegram({SOURCE: range(1, args.last_id + 1)}, latency=0.01, sent_log='sent.log')
+    if args.retry_after_call:
+        fake.fail('forwardMessages', *[None] * (args.retry_after_call - 1), retry_after(args.retry_after))
+    if args.slow_response_call:
+        fake.response_delays['forwardMessages'] = (args.slow_response_call - 1, args.slow_response)
+
+    bot = bot_main.FastForwardBot(request=fake)
+    print('ready', flush=True)
+    bot.run()
+
+if __name__ == '__main__':
+    main()
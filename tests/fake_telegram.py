@@ -0,0 +1,197 @@
+"""In-process fake of the Telegram Bot API.
+
+FakeTelegram plugs into python-telegram-bot as its request object, so a
+real ``telegram.Bot``/``Application`` talks to it exactly as it would to
+api.telegram.org: parameters are serialized by PTB, and error responses
+come back through PTB's own error mapping (BadRequest, RetryAfter, ...).
+All latency is ``asyncio.sleep``, so it runs on the virtual-time loop too.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, deque
+
+from telegram.error import TimedOut
+from telegram.request import BaseRequest
+
+TIMEOUT = 'timeout'
+
+def retry_after(seconds):
+    return ('retry_after', seconds)
+
+def bad_request(description):
+    return ('bad_request', description)
+
+class FakeTelegram(BaseRequest):
+    """Bot API state kept in memory.
+
+    - ``channels``: source chat id -> set of message ids that exist
+    - ``forwarded``: destination chat id -> [(new id, source id)], in send order
+    - ``updates``: queued updates served by getUpdates
+    - ``fail(method, *failures)`` makes the next calls of a method fail;
+      ``fail_randomly(method, rate, failure)`` fails a share of them
+    """
+
+    def __init__(self, channels=None, latency=0.0, seed=0, sent_log=None):
+        self.channels = {chat_id: set(ids) for chat_id, ids in (channels or {}).items()}
+        self.latency = latency
+        self.latencies = {}  # method -> latency override
+        self.chat_latencies = {}  # chat id -> extra latency for requests to that chat
+        self.response_delays = {}  # method -> (after this many calls, seconds the response takes)
+        self.random = random.Random(seed)
+        self.sent_log = sent_log  # file that gets one "chat source_id" line per forwarded message
+        self.forwarded = defaultdict(list)
+        self.next_message_id = defaultdict(lambda: 1)
+        self.updates = deque()
+        self.next_update_id = 1
+        self.calls = defaultdict(int)
+        self.failures = defaultdict(deque)
+        self.random_failures = {}
+        self.edits = []
+
+    # ==================== SCRIPTING ====================
+    def fail(self, method, *failures):
+        self.failures[method].extend(failures)
+
+    def fail_randomly(self, method, rate, failure):
+        self.random_failures[method] = (rate, failure)
+
+    def push_update(self, update):
+        update['update_id'] = self.next_update_id
+        self.next_update_id += 1
+        self.updates.append(update)
+        return update['update_id']
+
+    def command(self, user_id, text):
+        return self.push_update({'message': self._message(user_id, self._new_id(user_id), text,
+                                                          user=self._user(user_id), command=True)})
+
+    def click(self, user_id, data, message_id=1):
+        return self.push_update({'callback_query': {
+            'id': str(self.next_update_id), 'from': self._user(user_id), 'chat_instance': str(user_id),
+            'data': data, 'message': self._message(user_id, message_id, 'menu'),
+        }})
+
+    def sent_ids(self, chat_id):
+        """Source ids forwarded to a chat (and not deleted), in send order"""
+        return [source_id for _, source_id in self.forwarded[chat_id]]
+
+    # ==================== BaseRequest ====================
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api_method] += 1
+        latency = self.latencies.get(api_method, self.latency) + self.chat_latencies.get(params.get('chat_id'), 0)
+        if api_method == 'getUpdates' and not self.updates:
+            # Long poll: hold the request a little, like Telegram does
+            latency = max(latency, min(float(params.get('timeout') or 0), 0.2))
+        if latency:
+            await asyncio.sleep(latency)
+
+        failure = self._next_failure(api_method)
+        if failure == TIMEOUT:
+            raise TimedOut()
+        if failure is not None:
+            kind, value = failure
+            if kind == 'retry_after':
+                return self._error(429, f"Too Many Requests: retry after {value}", retry_after=value)
+            return self._error(400, f"Bad Request: {value}")
+
+        handler = getattr(self, f"api_{api_method}", None)
+        response = handler(params) if handler is not None else self._ok(True)
+        # A slow response: the request already took effect, the reply is late
+        after_calls, delay = self.response_delays.get(api_method, (0, 0))
+        if delay and self.calls[api_method] > after_calls:
+            await asyncio.sleep(delay)
+        return response
+
+    def _next_failure(self, method):
+        if self.failures[method]:
+            return self.failures[method].popleft()
+        rate, failure = self.random_failures.get(method, (0, None))
+        if rate and self.random.random() < rate:
+            return failure
+        return None
+
+    # ==================== API METHODS ====================
+    def api_getMe(self, params):
+        return self._ok({'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'})
+
+    def api_getUpdates(self, params):
+        offset = params.get('offset', 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        return self._ok(list(self.updates))
+
+    def api_sendMessage(self, params):
+        chat_id = params['chat_id']
+        return self._ok(self._message(chat_id, self._new_id(chat_id), params.get('text', '')))
+
+    def api_editMessageText(self, params):
+        self.edits.append(params.get('text', ''))
+        return self._ok(self._message(params['chat_id'], params['message_id'], params.get('text', '')))
+
+    def api_sendDocument(self, params):
+        chat_id = params['chat_id']
+        return self._ok(self._message(chat_id, self._new_id(chat_id), ''))
+
+    def api_forwardMessages(self, params):
+        source = params['from_chat_id']
+        if source not in self.channels:
+            return self._error(400, "Bad Request: chat not found")
+        chat_id = params['chat_id']
+        found = [message_id for message_id in params['message_ids'] if message_id in self.channels[source]]
+        if not found:
+            return self._error(400, "Bad Request: message to forward not found")
+        new_ids = [self._new_id(chat_id) for _ in found]
+        self.forwarded[chat_id].extend(zip(new_ids, found))
+        if self.sent_log:
+            with open(self.sent_log, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{chat_id} {message_id}\n" for message_id in found))
+        return self._ok([{'message_id': message_id} for message_id in new_ids])
+
+    def api_deleteMessages(self, params):
+        chat_id = params['chat_id']
+        deleted = set(params['message_ids'])
+        self.forwarded[chat_id] = [pair for pair in self.forwarded[chat_id] if pair[0] not in deleted]
+        return self._ok(True)
+
+    # ==================== HELPERS ====================
+    def _new_id(self, chat_id):
+        message_id = self.next_message_id[chat_id]
+        self.next_message_id[chat_id] += 1
+        return message_id
+
+    @staticmethod
+    def _user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+    def _message(self, chat_id, message_id, text, user=None, command=False):
+        message = {
+            'message_id': message_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'channel'},
+        }
+        if user is not None:
+            message['from'] = user
+        if command:
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    @staticmethod
+    def _ok(result):
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    @staticmethod
+    def _error(status, description, retry_after=None):
+        body = {'ok': False, 'error_code': status, 'description': description}
+        if retry_after is not None:
+            body['parameters'] = {'retry_after': retry_after}
+        return status, json.dumps(body).encode()
@@ -0,0 +1,19 @@
+from config import Config
+from handlers.admin_handlers import admin_handler
+from handlers.forward_handlers import ForwardJob, forward_handler
+from tests.conftest import CHANNELS
+from utils.planner import JobPlan
+from utils.progress_tracker import StatusMessage
+
+def test_panel_fits_in_one_message_with_many_jobs():
+    for user_id in range(1, 501):
+        job = ForwardJob(user_id, None, CHANNELS, JobPlan(9, 100), StatusMessage(None, user_id, 1))
+        job.messages_forwarded = user_id
+        forward_handler.jobs[user_id] = job
+
+    text = admin_handler.panel_text()
+    assert len(text) < 4096
+    assert "…and 480 more" in text
+    rows = admin_handler.panel_keyboard().inline_keyboard
+    assert len(rows) == Config.ADMIN_PANEL_JOBS + 1
+    assert rows[0][0].callback_data == "admin_pause_500"
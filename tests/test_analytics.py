@@ -0,0 +1,70 @@
+import os
+
+import database.analytics as analytics_module
+from database.analytics import Analytics
+
+class Clock:
+    def __init__(self, now=1_700_000_000):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_minutes_and_hours_are_written_to_disk(tmp_path):
+    clock = Clock(3600 * 500_000)
+    analytics = Analytics(str(tmp_path), clock)
+    analytics.record_forwarded(1, -100, 300)
+    clock.now += 1
+    analytics.record_forwarded(1, -100, 200)
+    analytics.record_throttle(1, -100, 5)
+    clock.now += 60
+    analytics.record_error(1, -100)
+    clock.now += 3600
+    analytics.tick()
+    analytics.flush()
+
+    minutes = analytics.minute_history(1)
+    assert [(m['forwarded'], m['errors'], m['throttled_seconds'], m['peak_rate']) for m in minutes] == [
+        (500, 0, 5, 25), (0, 1, 0, 0)
+    ]
+    assert os.path.getsize(tmp_path / '1.minutes') == 2 * analytics_module.MINUTE_RECORD.size
+    totals = analytics.user_totals(1)
+    assert (totals['forwarded'], totals['errors'], totals['throttle_minutes'], totals['peak_rate']) == (500, 1, 1, 25)
+
+def test_throttles_span_minutes_and_peaks_follow_pacing(tmp_path):
+    clock = Clock(3600 * 500_000)
+    analytics = Analytics(str(tmp_path), clock)
+    # 100-id batches paced at 25 msg/s, then a 300s RetryAfter
+    for _ in range(45):
+        analytics.record_forwarded(1, -100, 100)
+        clock.now += 4
+    analytics.record_throttle(1, -100, 300)
+    clock.now += 600
+    analytics.tick()
+
+    minutes = analytics.minute_history(1)
+    assert [m['throttled_seconds'] for m in minutes] == [0, 0, 0, 60, 60, 60, 60, 60]
+    assert {m['peak_rate'] for m in minutes if m['forwarded']} == {25}
+    totals = analytics.user_totals(1)
+    assert (totals['throttle_minutes'], totals['peak_rate']) == (5, 25)
+
+def test_failed_flush_does_not_write_records_twice(tmp_path, monkeypatch):
+    clock = Clock()
+    analytics = Analytics(str(tmp_path), clock)
+    for user_id in (1, 2):
+        analytics.record_forwarded(user_id, -100, 10)
+    clock.now += 60
+    analytics.tick()
+
+    real_open = open
+    def failing_open(path, *args, **kwargs):
+        if str(path).endswith('2.minutes'):
+            raise OSError("disk full")
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr('builtins.open', failing_open)
+    analytics.flush()
+    monkeypatch.setattr('builtins.open', real_open)
+    analytics.flush()
+
+    assert [m['forwarded'] for m in analytics.minute_history(1)] == [10]
+    assert [m['forwarded'] for m in analytics.minute_history(2)] == [10]
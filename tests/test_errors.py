@@ -0,0 +1,12 @@
+from telegram.error import BadRequest, RetryAfter, TimedOut
+
+from utils.errors import FATAL, PERMANENT, RATE_LIMITED, RETRYABLE, SKIP, classify_error
+
+def test_errors_are_classified():
+    assert classify_error(RetryAfter(5)) == RATE_LIMITED
+    assert classify_error(TimedOut()) == RETRYABLE
+    assert classify_error(BadRequest("Message to forward not found")) == SKIP
+    assert classify_error(BadRequest("Chat not found")) == FATAL
+    # A source with protected content rejects every message, not just this one
+    assert classify_error(BadRequest("Message can't be forwarded")) == FATAL
+    assert classify_error(BadRequest("Message is too long")) == PERMANENT
@@ -0,0 +1,150 @@
+import asyncio
+
+from config import Config
+from database.dead_letters import DeadLetterLog
+from database.job_manager import job_manager
+from database.message_map import message_maps
+from handlers.forward_handlers import ForwardJob, forward_handler
+from handlers.setup_handlers import setup_handler
+from tests.conftest import CHANNELS, DESTINATION, SOURCE, click, full_channel, make_bot, wait_for_jobs
+from tests.fake_telegram import TIMEOUT
+from utils.planner import JobPlan
+from utils.progress_tracker import StatusMessage
+from utils.scheduler import scheduler
+from utils.virtual_time import run
+
+def start_job(bot, plan, user_id=1):
+    job = ForwardJob(user_id, bot, CHANNELS, plan, StatusMessage(bot, user_id, 1))
+    forward_handler.jobs[user_id] = job
+    job_manager.save_job(user_id, job.state())
+    forward_handler.launch(job)
+    return job
+
+def probed_plan(windows, window=100):
+    return JobPlan(windows - 1, window, {index: window for index in range(windows)})
+
+def test_quota_stop_keeps_checkpoint_and_next_start_continues():
+    async def main():
+        fake = full_channel(500)
+        bot = await make_bot(fake)
+        setup_handler.user_channels[1] = CHANNELS
+        scheduler.set_quota(1, 250)
+        start_job(bot, probed_plan(5))
+        await wait_for_jobs()
+
+        sent_first_day = fake.sent_ids(DESTINATION)
+        assert 0 < len(sent_first_day) <= 250
+        saved = job_manager.get_job(1)
+        assert saved['status'] == 'quota_reached'
+        assert saved['messages_forwarded'] == len(sent_first_day)
+
+        # Next day: starting again resumes instead of re-planning from id 1
+        scheduler.usage.clear()
+        scheduler.set_quota(1, None)
+        await forward_handler.start_forwarding(click(fake, bot, 1, 'menu_start_forward'), None)
+        await wait_for_jobs()
+        assert fake.sent_ids(DESTINATION) == list(range(1, 501))
+        assert job_manager.get_job(1) is None
+    run(main())
+
+def test_paused_job_resumes_from_its_checkpoint():
+    async def main():
+        fake = full_channel(500)
+        bot = await make_bot(fake)
+        start_job(bot, probed_plan(5))
+        await asyncio.sleep(5)
+        forward_handler.pause_job(1)
+        await wait_for_jobs()
+        sent_before_pause = fake.sent_ids(DESTINATION)
+        assert 0 < len(sent_before_pause) < 500
+        assert job_manager.get_job(1)['status'] == 'paused'
+        assert job_manager.resumable_jobs() == {}
+
+        await forward_handler.resume_forwarding(click(fake, bot, 1, 'forward_resume'), None)
+        await wait_for_jobs()
+        assert fake.sent_ids(DESTINATION) == list(range(1, 501))
+        assert job_manager.get_job(1) is None
+    run(main())
+
+def test_unprobed_windows_stay_within_quota_and_rate():
+    async def main():
+        # Window 0 is half empty, so the plan guesses 50 messages for every
+        # other window; they actually hold 100
+        fake = full_channel(2000, gaps=range(51, 101))
+        bot = await make_bot(fake)
+        scheduler.set_quota(1, 1000)
+        started = asyncio.get_running_loop().time()
+        start_job(bot, JobPlan(19, 100, {0: 50}))
+        await wait_for_jobs()
+
+        sent = fake.sent_ids(DESTINATION)
+        assert sent == [*range(1, 51), *range(101, 1051)]
+        assert scheduler.quota_left(1) == 0
+        # The first batch goes out at once, every later message is paced
+        assert asyncio.get_running_loop().time() - started >= (1000 - 100) / scheduler.global_rate
+    run(main())
+
+def test_messages_past_the_planned_end_are_still_sent():
+    async def main():
+        fake = full_channel(1000)
+        bot = await make_bot(fake)
+        # Planned before ids 501-1000 were posted
+        job = start_job(bot, probed_plan(5))
+        await wait_for_jobs()
+        assert fake.sent_ids(DESTINATION) == list(range(1, 1001))
+        assert job.plan.last_window == 9
+        assert job_manager.get_job(1) is None
+    run(main())
+
+def test_failed_status_edits_do_not_stop_the_job():
+    async def main():
+        fake = full_channel(500)
+        fake.fail('editMessageText', *[TIMEOUT] * 20)
+        bot = await make_bot(fake)
+        start_job(bot, probed_plan(5))
+        await wait_for_jobs()
+        assert fake.sent_ids(DESTINATION) == list(range(1, 501))
+        assert job_manager.get_job(1) is None
+    run(main())
+
+def test_replay_runs_as_a_job_and_keeps_what_still_fails():
+    async def main():
+        fake = full_channel(100)
+        bot = await make_bot(fake)
+        setup_handler.user_channels[1] = CHANNELS
+        DeadLetterLog(1, 1000).add([5, 6, 7, 20], "Network error")
+
+        await forward_handler.replay_failed(click(fake, bot, 1, 'forward_failed_replay'), None)
+        assert 1 in forward_handler.jobs and DeadLetterLog.latest(1) is None
+        await wait_for_jobs()
+        assert fake.sent_ids(DESTINATION) == [5, 6, 7, 20]
+        assert DeadLetterLog.latest(1) is None and job_manager.get_job(1) is None
+
+        # The source is gone and the error message can't be shown either: the
+        # job still ends and the ids are dead-lettered again
+        DeadLetterLog(1, 1000).add([5, 6, 7, 20], "Network error")
+        setup_handler.user_channels[1] = {**CHANNELS, 'source': {'id': -999, 'title': 'Gone', 'username': None}}
+        fake.fail('editMessageText', None, *[TIMEOUT] * 20)
+        await forward_handler.replay_failed(click(fake, bot, 1, 'forward_failed_replay'), None)
+        await wait_for_jobs()
+        assert forward_handler.jobs == {} and job_manager.get_job(1) is None
+        assert sorted(entry['message_id'] for entry in DeadLetterLog.latest(1).entries()) == [5, 6, 7, 20]
+    run(main())
+
+def test_windows_with_gaps_are_mapped_message_by_message(monkeypatch):
+    monkeypatch.setattr(Config, 'MAP_PARTIAL_BATCHES', True)
+    async def main():
+        gaps = set(range(107, 500, 20))
+        fake = full_channel(500, gaps=gaps)
+        bot = await make_bot(fake)
+        # Window 0 was probed full and goes as one batch, the rest are unknown
+        start_job(bot, JobPlan(4, 100, {0: 100}))
+        await wait_for_jobs()
+
+        assert fake.sent_ids(DESTINATION) == sorted(set(range(1, 501)) - gaps)
+        # ...and so do the two windows past the planned end, which come back empty
+        assert fake.calls['forwardMessages'] == 1 + 400 + 2 * 100
+        for destination_id, source_id in fake.forwarded[DESTINATION]:
+            assert message_maps.lookup(SOURCE, DESTINATION, source_id) == destination_id
+        assert all(message_maps.lookup(SOURCE, DESTINATION, gap) is None for gap in gaps)
+    run(main())
@@ -0,0 +1,33 @@
+from config import Config
+from database.message_map import MessageMaps
+
+def test_least_recently_used_maps_are_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'MESSAGE_MAPS_OPEN', 2)
+    maps = MessageMaps(str(tmp_path))
+    for destination_id in (-1, -2, -3):
+        maps.get(-100, destination_id).add([(5, 1000 + destination_id)])
+        maps.lookup(-100, -1, 5)  # keeps -1 recently used
+
+    assert list(maps.maps) == [(-100, -3), (-100, -1)]
+    # An evicted map reads back from its file
+    assert maps.lookup(-100, -2, 5) == 998
+    assert list(maps.maps) == [(-100, -1), (-100, -2)]
+
+    maps.release(-100, -2)
+    assert list(maps.maps) == [(-100, -1)]
+    maps.close()
+
+def test_forwarding_the_same_source_again_rebases_blocks(tmp_path):
+    maps = MessageMaps(str(tmp_path))
+    message_map = maps.get(-100, -200)
+    # Each run lands 100k destination ids later, too far for the old bases
+    for run in range(1, 4):
+        for first in range(1, 2001, 100):
+            message_map.add((source_id, run * 100_000 + source_id) for source_id in range(first, first + 100))
+        assert message_map._overflow_ids() == {}
+        assert message_map._overflow_lines < 2 * 1024
+
+    reopened = MessageMaps(str(tmp_path))
+    assert all(reopened.lookup(-100, -200, source_id) == 300_000 + source_id for source_id in range(1, 2001))
+    maps.close()
+    reopened.close()
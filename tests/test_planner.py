@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest
+
+from config import Config
+from handlers.forward_handlers import forward_handler
+from handlers.setup_handlers import setup_handler
+from tests.conftest import CHANNELS, SOURCE, click, full_channel, make_bot
+from tests.fake_telegram import retry_after
+from utils.planner import JobPlanner, bot_probe
+from utils.scheduler import scheduler
+from utils.virtual_time import run
+
+PROBE_CHAT = -300
+
+def test_probes_find_the_range_and_clean_up():
+    async def main():
+        fake = full_channel(950, gaps=range(300, 420))
+        fake.fail('forwardMessages', None, retry_after(5))
+        bot = await make_bot(fake)
+        plan = await JobPlanner(bot_probe(bot, SOURCE, PROBE_CHAT, 1)).plan()
+        assert plan.last_id == 1000
+        assert fake.forwarded[PROBE_CHAT] == []
+    run(main())
+
+def test_missing_source_fails_planning():
+    async def main():
+        bot = await make_bot(full_channel(100))
+        with pytest.raises(BadRequest, match="(?i)chat not found"):
+            await JobPlanner(bot_probe(bot, SOURCE - 1, PROBE_CHAT, 1)).plan()
+    run(main())
+
+def test_a_deleted_run_does_not_end_the_range():
+    async def main():
+        bot = await make_bot(full_channel(5000, gaps=range(1601, 1801)))
+        plan = await JobPlanner(bot_probe(bot, SOURCE, PROBE_CHAT, 1)).plan()
+        assert plan.last_id == 5000
+    run(main())
+
+def test_planning_runs_in_the_background(monkeypatch):
+    monkeypatch.setattr(Config, 'PROBE_CHAT_ID', PROBE_CHAT)
+    async def main():
+        fake = full_channel(20_000)
+        bot = await make_bot(fake)
+        setup_handler.user_channels[1] = CHANNELS
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await forward_handler.start_forwarding(click(fake, bot, 1, 'menu_start_forward'), None)
+        assert loop.time() == started and 1 in forward_handler.planning
+
+        await forward_handler.planning[1]
+        plan, _ = forward_handler.pending_plans[1]
+        assert plan.last_id == 20_000
+        assert "FORWARDING PLAN" in fake.edits[-1]
+        # Only the probed messages that exist took send time
+        sent = sum(count for count in plan.counts)
+        assert loop.time() - started < sent / scheduler.global_rate + 1
+    run(main())
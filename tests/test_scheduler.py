@@ -0,0 +1,64 @@
+import asyncio
+
+from utils.scheduler import BULK, INTERACTIVE, ForwardScheduler
+from utils.virtual_time import run
+
+def test_controls_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'scheduler.json')
+    scheduler = ForwardScheduler(path=path)
+    scheduler.set_global_rate(12)
+    scheduler.set_user_rate(7, 3)
+    scheduler.set_quota(7, 5000)
+    scheduler.set_draining(True)
+    scheduler._count(7, 42)
+    scheduler.save()
+
+    restarted = ForwardScheduler(path=path)
+    restarted.load()
+    assert restarted.global_rate == 12
+    assert restarted.user_rates == {7: 3}
+    assert restarted.quotas == {7: 5000}
+    assert restarted.quota_left(7) == 5000 - 42
+    assert restarted.draining
+
+def test_shutdown_drain_is_not_saved(tmp_path):
+    path = str(tmp_path / 'scheduler.json')
+    scheduler = ForwardScheduler(path=path)
+    scheduler.set_draining(True, save=False)
+    scheduler.save()
+
+    restarted = ForwardScheduler(path=path)
+    restarted.load()
+    assert not restarted.draining
+
+def test_bulk_does_not_wait_for_a_capped_higher_class(tmp_path):
+    async def main():
+        scheduler = ForwardScheduler(path=str(tmp_path / 'scheduler.json'))
+        scheduler.set_user_rate(1, 0.1)
+        await scheduler.acquire(1, 1, INTERACTIVE)
+        # User 1 can't send for another 10s; bulk gets the slots meanwhile
+        waiting = asyncio.create_task(scheduler.acquire(1, 1, INTERACTIVE))
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(50):
+            await scheduler.acquire(2, 1, BULK)
+        assert loop.time() - start < 50 / scheduler.global_rate + 1
+        assert not waiting.done()
+        await waiting
+    run(main())
+
+def test_rate_changes_reach_queued_senders(tmp_path):
+    async def main():
+        scheduler = ForwardScheduler(path=str(tmp_path / 'scheduler.json'))
+        scheduler.set_global_rate(0.1)
+        await scheduler.acquire(1)
+        queued = [asyncio.create_task(scheduler.acquire(user_id)) for user_id in range(2, 12)]
+        await asyncio.sleep(1)
+        assert not any(task.done() for task in queued)
+        # The next slot was 10s away; at 25 msg/s all ten go within half a second
+        scheduler.set_global_rate(25)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        assert await asyncio.gather(*queued) == [1] * 10
+        assert loop.time() - start < 0.5
+    run(main())
@@ -0,0 +1,82 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from tests.conftest import CHANNELS, DESTINATION
+from utils.planner import JobPlan
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAST_ID = 300
+
+def seed_job(tmp_path):
+    """A running job over ids 1..LAST_ID, as a previous process would have left it"""
+    plan = JobPlan(LAST_ID // 20 - 1, 20, {index: 20 for index in range(LAST_ID // 20)})
+    state = {
+        'channels': CHANNELS, 'chat_id': 1, 'message_id': 1, 'plan': plan.to_dict(),
+        'started_at': time.time(), 'messages_forwarded': 0, 'next_window': 0,
+        'retries': [], 'status': 'running',
+    }
+    (tmp_path / 'jobs_state.json').write_text(json.dumps({'1': state}))
+
+def start_bot(tmp_path, *args):
+    env = dict(os.environ, BOT_TOKEN='1:fake', PORT='0', PYTHONPATH=ROOT)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'tests.fake_bot_process', '--last-id', str(LAST_ID), *args],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def sent_ids(tmp_path):
+    path = tmp_path / 'sent.log'
+    if not path.exists():
+        return []
+    lines = path.read_text().splitlines()
+    assert all(line.split()[0] == str(DESTINATION) for line in lines)
+    return [int(line.split()[1]) for line in lines]
+
+def wait_until(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def job_done(tmp_path):
+    return json.loads((tmp_path / 'jobs_state.json').read_text()) == {}
+
+def stop(process, timeout=15):
+    process.send_signal(signal.SIGTERM)
+    return process.wait(timeout)
+
+def finish_after_restart(tmp_path):
+    process = start_bot(tmp_path)
+    try:
+        wait_until(lambda: job_done(tmp_path))
+    finally:
+        stop(process)
+    assert sent_ids(tmp_path) == list(range(1, LAST_ID + 1))
+
+def test_sigterm_during_retry_after_pause(tmp_path):
+    seed_job(tmp_path)
+    # The third batch gets a 60s RetryAfter; shutdown must not wait it out
+    process = start_bot(tmp_path, '--retry-after-call', '3', '--retry-after', '60', '--grace', '30')
+    wait_until(lambda: len(sent_ids(tmp_path)) == 40)
+    time.sleep(0.5)
+    started = time.monotonic()
+    stop(process)
+    assert time.monotonic() - started < 10
+    assert sent_ids(tmp_path) == list(range(1, 41))
+    assert json.loads((tmp_path / 'jobs_state.json').read_text())['1']['status'] == 'running'
+
+    finish_after_restart(tmp_path)
+
+def test_sigterm_while_a_batch_is_in_flight(tmp_path):
+    seed_job(tmp_path)
+    # Telegram has forwarded the third batch but its response is slow
+    process = start_bot(tmp_path, '--slow-response-call', '3', '--slow-response', '2', '--grace', '10')
+    wait_until(lambda: len(sent_ids(tmp_path)) == 60)
+    stop(process)
+    assert sent_ids(tmp_path) == list(range(1, 61))
+
+    finish_after_restart(tmp_path)
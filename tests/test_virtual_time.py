@@ -0,0 +1,39 @@
+import asyncio
+import socket
+import threading
+import time
+
+from utils.virtual_time import run
+
+def test_sleeps_cost_no_real_time():
+    async def main():
+        await asyncio.sleep(3600)
+        return asyncio.get_running_loop().time()
+    started = time.monotonic()
+    assert run(main()) == 3600
+    assert time.monotonic() - started < 1
+
+def test_real_io_is_waited_for():
+    async def main():
+        ours, theirs = socket.socketpair()
+        threading.Timer(0.2, theirs.send, [b'x']).start()
+        reader, writer = await asyncio.open_connection(sock=ours)
+        data = await asyncio.wait_for(reader.read(1), 5)
+        writer.close()
+        theirs.close()
+        return data
+    assert run(main()) == b'x'
+
+def test_leftover_tasks_are_cancelled():
+    cancelled = []
+    async def forever():
+        try:
+            await asyncio.sleep(10 ** 9)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    async def main():
+        asyncio.create_task(forever())
+        await asyncio.sleep(0)
+    run(main())
+    assert cancelled == [True]
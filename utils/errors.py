@@ -0,0 +1,87 @@
+import heapq
+import random
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from config import Config
+from utils.helpers import loop_time
+
+# How a failed send is handled
+SKIP = 'skip'                  # message is gone or empty: nothing to send, move on
+PERMANENT = 'permanent'        # message can't be sent: dead-letter it
+RETRYABLE = 'retryable'        # transient network trouble: retry later with backoff
+RATE_LIMITED = 'rate_limited'  # Telegram asked us to slow down: the scheduler waits
+FATAL = 'fatal'                # the job itself can't continue (rights, missing chat, ...)
+
+GAP_ERRORS = ('message to forward not found', 'message to copy not found',
+              'message not found', 'message_id_invalid', 'message is empty', 'message_empty')
+# "Can't be forwarded" means the source protects its content, which holds for every message in it
+CHAT_ERRORS = ('chat not found', 'rights', 'chat_admin_required', 'not a member',
+               'chat_write_forbidden', 'have no access', 'bot was kicked', "message can't be forwarded")
+
+def classify_error(error):
+    """Sort a Telegram error into one of the handling classes above"""
+    if isinstance(error, RetryAfter):
+        return RATE_LIMITED
+    # BadRequest is a NetworkError subclass, so it must be checked first
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if any(text in message for text in CHAT_ERRORS):
+            return FATAL
+        if any(text in message for text in GAP_ERRORS):
+            return SKIP
+        return PERMANENT
+    if isinstance(error, NetworkError):
+        return RETRYABLE
+    return FATAL
+
+def retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+def retry_delay(attempt):
+    """Exponential backoff with jitter for the given attempt (1-based)"""
+    delay = min(Config.RETRY_MAX_DELAY, Config.RETRY_BASE_DELAY * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class RetryQueue:
+    """Message ids waiting for another attempt, ordered by when they are due.
+
+    The engine keeps sending new batches while items here wait out their
+    backoff, and picks them up again once due. Retried ids are always a
+    contiguous run (a window or the tail of one), so each item is kept as a
+    `range` rather than a list of ids.
+    """
+
+    __slots__ = ('clock', '_heap')
+
+    def __init__(self, items=(), clock=loop_time):
+        self.clock = clock
+        self._heap = []
+        for first_id, count, attempt in items:
+            self.push(range(first_id, first_id + count), attempt, delay=0)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, ids, attempt, delay=None):
+        delay = retry_delay(attempt) if delay is None else delay
+        ids = range(ids[0], ids[-1] + 1) if not isinstance(ids, range) else ids
+        heapq.heappush(self._heap, (self.clock() + delay, ids.start, ids, attempt))
+
+    def pop_due(self):
+        """Next (ids, attempt) whose backoff has passed, or None"""
+        if self._heap and self._heap[0][0] <= self.clock():
+            _, _, ids, attempt = heapq.heappop(self._heap)
+            return ids, attempt
+        return None
+
+    def next_due_in(self):
+        return max(0.0, self._heap[0][0] - self.clock()) if self._heap else None
+
+    def snapshot(self):
+        """Pending items as [first id, count, attempt], for the job state file"""
+        return [[ids.start, len(ids), attempt] for _, _, ids, attempt in sorted(self._heap)]
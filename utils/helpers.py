@@ -1 +1,11 @@
+import asyncio
 
+def chat_ref(channel):
+    """Chat id to use in API calls for a stored channel (numeric id, else @username)"""
+    if channel.get('id') is not None:
+        return channel['id']
+    return f"@{channel['username']}"
+
+def loop_time():
+    """Clock of the running event loop: time.monotonic, unless a virtual-time loop runs us"""
+    return asyncio.get_running_loop().time()
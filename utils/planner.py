@@ -0,0 +1,199 @@
+import logging
+from array import array
+from bisect import bisect_left
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import Config
+from utils.errors import SKIP, classify_error, retry_after_seconds
+from utils.scheduler import INTERACTIVE, scheduler
+
+logger = logging.getLogger(__name__)
+
+class JobPlan:
+    """What a forwarding job will do, worked out before it starts.
+
+    Message ids are split into windows of `window` ids, one window per
+    `forward_messages` request. The probed message count of each window the
+    planner looked at is kept in two parallel arrays (a few bytes per probe,
+    not a dict entry), so the engine can skip windows already known to be
+    empty instead of asking again.
+    """
+
+    __slots__ = ('last_window', 'window', 'probed', 'counts', 'probe_requests',
+                 'density', 'estimated_messages', 'request_count')
+
+    def __init__(self, last_window, window=Config.BATCH_SIZE, window_counts=None, probe_requests=0,
+                 estimated_messages=None):
+        self.last_window = last_window  # None for an empty source (or a replay, which only has retries)
+        self.window = window
+        self.probe_requests = probe_requests
+        items = sorted((window_counts or {}).items())
+        self.probed = array('I', [index for index, _ in items])
+        self.counts = array('H', [count for _, count in items])
+
+        # Everything below only depends on the probes, so work it out once
+        in_range = [count for index, count in items if last_window is not None and index <= last_window]
+        windows = 0 if last_window is None else last_window + 1
+        self.density = sum(in_range) / (len(in_range) * window) if in_range else 1.0
+        self.request_count = windows - in_range.count(0)
+        self.estimated_messages = sum(in_range) + (windows - len(in_range)) * round(window * self.density)
+        if estimated_messages is not None:
+            self.estimated_messages = estimated_messages
+
+    @property
+    def first_id(self):
+        return 1
+
+    @property
+    def last_id(self):
+        return 0 if self.last_window is None else (self.last_window + 1) * self.window
+
+    def window_ids(self, index):
+        start = index * self.window + 1
+        return range(start, start + self.window)
+
+    def window_count(self, index):
+        """Probed message count of a window, or None if it wasn't probed"""
+        position = bisect_left(self.probed, index)
+        if position < len(self.probed) and self.probed[position] == index:
+            return self.counts[position]
+        return None
+
+    def next_window(self, start):
+        """First window at or after `start` that has to be sent, or None when done"""
+        if self.last_window is None:
+            return None
+        for index in range(start, self.last_window + 1):
+            if self.window_count(index) != 0:
+                return index
+        return None
+
+    def eta_seconds(self, rate, messages=None):
+        """Seconds to forward `messages` (default: all) at `rate`, including rests"""
+        messages = self.estimated_messages if messages is None else messages
+        sending = messages / rate
+        rests = int(sending // Config.BURST_DURATION) * Config.REST_DURATION
+        return sending + rests
+
+    def to_dict(self):
+        return {
+            'last_window': self.last_window,
+            'window': self.window,
+            'window_counts': {str(index): count for index, count in zip(self.probed, self.counts)},
+            'probe_requests': self.probe_requests,
+            'estimated_messages': self.estimated_messages,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['last_window'], data['window'],
+            {int(k): v for k, v in data['window_counts'].items()}, data.get('probe_requests', 0),
+            data.get('estimated_messages')
+        )
+
+class JobPlanner:
+    """Find a source channel's message id range in O(log N) probes.
+
+    `probe(ids)` must return how many of `ids` exist. Exponential search
+    over windows finds an upper bound, then binary search narrows it down
+    to the last non-empty window. A window only counts as "past the end"
+    when PROBE_EMPTY_WINDOWS windows in a row are empty, and the end found
+    is only trusted once PROBE_END_CHECKS probes 1, 2, 4... windows further
+    out are empty too, so a run of deleted messages doesn't cut the range
+    short: a probe that finds messages restarts the search from there.
+    """
+
+    def __init__(self, probe, window=Config.BATCH_SIZE):
+        self.probe = probe
+        self.window = window
+        self.window_counts = {}
+        self.probe_requests = 0
+
+    async def count(self, index):
+        if index not in self.window_counts:
+            start = index * self.window + 1
+            self.window_counts[index] = await self.probe(list(range(start, start + self.window)))
+            self.probe_requests += 1
+        return self.window_counts[index]
+
+    async def past_end(self, index):
+        for next_index in range(index, index + Config.PROBE_EMPTY_WINDOWS):
+            if await self.count(next_index):
+                return False
+        return True
+
+    async def last_window(self, low):
+        """Last window with messages from `low` on, given past_end(low) is False"""
+        # Exponential search for a window past the end...
+        step = 1
+        while not await self.past_end(low + step):
+            low, step = low + step, step * 2
+        high = low + step
+        # ...then binary search between the last window with messages and it
+        while high - low > 1:
+            middle = (low + high) // 2
+            if await self.past_end(middle):
+                high = middle
+            else:
+                low = middle
+        # Windows after `low` up to high+PROBE_EMPTY_WINDOWS are empty, so the
+        # non-empty window that stopped past_end(low) is `low` itself
+        return low
+
+    async def further(self, index):
+        """A window with messages beyond the empty run starting at `index`, or None"""
+        distance = 1
+        for _ in range(Config.PROBE_END_CHECKS):
+            next_index = index + Config.PROBE_EMPTY_WINDOWS - 1 + distance
+            if await self.count(next_index):
+                return next_index
+            distance *= 2
+        return None
+
+    async def plan(self):
+        last, index = None, 0
+        while index is not None:
+            if not await self.past_end(index):
+                last = await self.last_window(index)
+                index = last + 1
+            index = await self.further(index)
+        return JobPlan(last, self.window, self.window_counts, self.probe_requests)
+
+def bot_probe(bot, source, probe_chat, user_id):
+    """Probe that forwards ids to a scratch chat, counts them and deletes them again.
+
+    Probes are paced by the scheduler like any send (but don't use up the
+    user's quota), and the slots of ids that don't exist are given back, so
+    empty windows cost a request but no send time. Only "message not found"
+    means an empty window; any other error, such as a missing source chat or
+    missing rights, is raised so planning fails instead of finding an empty
+    channel.
+    """
+    async def probe(ids):
+        while True:
+            if not await scheduler.acquire(user_id, len(ids), INTERACTIVE, quota=False):
+                raise TelegramError("Bot is shutting down")
+            try:
+                sent = await bot.forward_messages(
+                    chat_id=probe_chat, from_chat_id=source, message_ids=ids, disable_notification=True
+                )
+                break
+            except RetryAfter as e:
+                scheduler.refund(user_id, len(ids), quota=False)
+                scheduler.pause_for(retry_after_seconds(e))
+            except TelegramError as e:
+                scheduler.refund(user_id, len(ids), quota=False)
+                if isinstance(e, BadRequest) and classify_error(e) == SKIP:
+                    # None of the ids exist
+                    return 0
+                raise
+        scheduler.refund(user_id, len(ids) - len(sent), quota=False)
+        if sent:
+            try:
+                await bot.delete_messages(probe_chat, [message.message_id for message in sent])
+            except BadRequest as e:
+                logger.warning(f"Could not clean up probe messages: {e}")
+        return len(sent)
+    return probe
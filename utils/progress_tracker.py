@@ -1 +1,25 @@
+import logging
 
+logger = logging.getLogger(__name__)
+
+class StatusMessage:
+    """The chat message a forwarding job edits to show its progress.
+
+    Behaves like the ``CallbackQuery`` the job was started from (``.bot`` and
+    ``edit_message_text``), but only needs a chat id and message id, so a
+    job restored after a restart can keep editing the same message.
+    """
+
+    def __init__(self, bot, chat_id, message_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    @classmethod
+    def from_query(cls, query):
+        return cls(query.get_bot(), query.message.chat_id, query.message.message_id)
+
+    async def edit_message_text(self, text, **kwargs):
+        return await self.bot.edit_message_text(
+            text, chat_id=self.chat_id, message_id=self.message_id, **kwargs
+        )
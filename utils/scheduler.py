@@ -0,0 +1,364 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from config import Config
+from utils.helpers import loop_time
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+REALTIME = 0     # live mirror posts that should land within seconds
+INTERACTIVE = 1  # small jobs a user is watching
+BULK = 2         # large backfills
+PRIORITY_NAMES = {REALTIME: 'realtime', INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+class ForwardScheduler:
+    """Shared send budget for every forwarding job.
+
+    Engines call `acquire(user_id)` before each send. The global cap limits
+    the whole bot, per-user caps and daily quotas limit single users, and all
+    of them can be changed at runtime; a change takes effect for engines
+    that are already waiting.
+
+    Each send also carries a priority class. Waiting sends queue per class,
+    ordered by when their user may send next, and one dispatcher task hands
+    out each slot as it comes due: to the highest class with a sender that
+    can go now, except that bulk jobs always keep BULK_MIN_SHARE of the
+    recent send slots so a steady stream of urgent sends can't starve them.
+    """
+
+    def __init__(self, clock=loop_time, path=None):
+        self.clock = clock
+        self.path = path or Config.SCHEDULER_FILE
+        self.global_rate = Config.MAX_SPEED
+        self.user_rates = {}   # user_id -> msg/sec cap
+        self.quotas = {}       # user_id -> messages per day
+        self.usage = {}        # user_id -> [day, messages sent that day]
+        self.draining = False
+        self.closed = False  # set on shutdown: no more slots are handed out
+        self._drain_setting = False  # the admin's choice, which is what gets saved
+        # Time of the last granted send; the next one is due 1/rate later.
+        # Storing the past send (not the next due time) lets rate changes
+        # apply to engines that are already waiting.
+        self._global_last = float('-inf')
+        self._user_last = {}
+        self._paused_until = float('-inf')
+        # Per priority class, a heap of (earliest send time, seq, user_id, count, quota, future);
+        # the times only ever lag behind the user's real ready time
+        self._queues = [[] for _ in PRIORITY_NAMES]
+        self._seq = itertools.count()
+        self._waiting = {}  # user_id -> queued acquires
+        self._dispatcher = None
+        self._dispatch_event = asyncio.Event()
+        self._recent = deque(maxlen=Config.PRIORITY_WINDOW)  # (priority, slots) of the latest grants
+        self._recent_slots = [0] * len(PRIORITY_NAMES)
+        # Parked jobs: (due, key, callback) entries served by one timer task
+        self._parked = []
+        self._waker = None
+        self._wake_event = asyncio.Event()
+
+    # ==================== CONTROLS ====================
+    def set_global_rate(self, rate):
+        if not 0 < rate <= Config.MAX_ALLOWED_SPEED:
+            raise ValueError(f"Rate must be between 0 and {Config.MAX_ALLOWED_SPEED} msg/sec")
+        self.global_rate = rate
+        self._changed()
+        self.save()
+        logger.info(f"Global rate set to {rate} msg/sec")
+
+    def set_user_rate(self, user_id, rate):
+        """Cap one user's rate; None removes the cap"""
+        if rate is None:
+            self.user_rates.pop(user_id, None)
+        elif rate <= 0:
+            raise ValueError("Rate must be positive")
+        else:
+            self.user_rates[user_id] = rate
+        self._changed(user_id)
+        self.save()
+
+    def set_quota(self, user_id, messages_per_day):
+        """Limit one user's messages per day; None removes the quota"""
+        if messages_per_day is None:
+            self.quotas.pop(user_id, None)
+        elif messages_per_day < 0:
+            raise ValueError("Quota can't be negative")
+        else:
+            self.quotas[user_id] = messages_per_day
+        self._dispatch_event.set()
+        self.save()
+
+    def set_draining(self, draining, save=True):
+        """Accept no new jobs while draining; save=False for a drain that shouldn't outlive the process"""
+        self.draining = draining
+        if save:
+            self._drain_setting = draining
+            self.save()
+        logger.info(f"Drain mode {'ON' if draining else 'OFF'}")
+
+    # ==================== PERSISTENCE ====================
+    def load(self):
+        """Restore the controls and today's usage saved by the previous process"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read scheduler state {self.path}: {e}")
+            return
+        self.global_rate = min(state.get('global_rate', self.global_rate), Config.MAX_ALLOWED_SPEED)
+        self.user_rates = {int(k): v for k, v in state.get('user_rates', {}).items()}
+        self.quotas = {int(k): v for k, v in state.get('quotas', {}).items()}
+        self.usage = {int(k): v for k, v in state.get('usage', {}).items()}
+        self.draining = self._drain_setting = state.get('draining', False)
+
+    def save(self):
+        """Write rate caps, quotas, usage and drain mode atomically"""
+        state = {
+            'global_rate': self.global_rate,
+            'user_rates': self.user_rates,
+            'quotas': self.quotas,
+            'usage': {user_id: usage for user_id, usage in self.usage.items() if usage[0] == self._today()},
+            'draining': self._drain_setting,
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Could not write scheduler state {self.path}: {e}")
+
+    # ==================== BUDGET ====================
+    def rate_for(self, user_id):
+        """Effective msg/sec a single job of this user may reach"""
+        return min(self.global_rate, self.user_rates.get(user_id, self.global_rate))
+
+    def projected_rate(self, user_id, running_jobs):
+        """Rate a new job can expect while `running_jobs` others share the global cap"""
+        return min(self.rate_for(user_id), self.global_rate / (running_jobs + 1))
+
+    def quota_left(self, user_id):
+        """Messages left today, or None when the user has no quota"""
+        quota = self.quotas.get(user_id)
+        if quota is None:
+            return None
+        day, used = self.usage.get(user_id, (None, 0))
+        if day != self._today():
+            used = 0
+        return max(0, quota - used)
+
+    def _today(self):
+        return int(time.time() // 86400)
+
+    def _count(self, user_id, count):
+        today = self._today()
+        usage = self.usage.get(user_id)
+        if usage is None or usage[0] != today:
+            usage = self.usage[user_id] = [today, 0]
+        usage[1] += count
+
+    def _user_ready(self, user_id):
+        return self._user_last.get(user_id, float('-inf')) + 1 / self.rate_for(user_id)
+
+    def _bulk_yields(self):
+        """Whether bulk must leave a slot to a higher class that can use it now"""
+        total = sum(self._recent_slots)
+        return bool(total) and self._recent_slots[BULK] / total >= Config.BULK_MIN_SHARE
+
+    def _record_grant(self, priority, count):
+        if len(self._recent) == self._recent.maxlen:
+            old_priority, old_count = self._recent[0]
+            self._recent_slots[old_priority] -= old_count
+        self._recent.append((priority, count))
+        self._recent_slots[priority] += count
+
+    def _grant(self, user_id, count, priority, quota, now):
+        """Take `count` slots (fewer if the quota runs out) at time `now`"""
+        if quota:
+            quota_left = self.quota_left(user_id)
+            if quota_left is not None:
+                count = min(count, quota_left)
+                if count == 0:
+                    return 0
+        # A batch of `count` uses `count` slots; absorb up to one tick of
+        # timer lateness without allowing bursts
+        global_ready = self._global_last + 1 / self.global_rate
+        self._global_last = max(global_ready, now - Config.SCHEDULER_TICK) + (count - 1) / self.global_rate
+        user_ready = self._user_ready(user_id)
+        self._user_last[user_id] = max(user_ready, now - Config.SCHEDULER_TICK) + (count - 1) / self.rate_for(user_id)
+        if quota:
+            self._count(user_id, count)
+        self._record_grant(priority, count)
+        return count
+
+    async def acquire(self, user_id, count=1, priority=BULK, quota=True):
+        """Wait for `count` send slots (one batch request).
+
+        Returns the number of slots granted, which is less than `count` only
+        when the user's quota runs out, and 0 once it is used up or once the
+        scheduler is closed for shutdown. With quota=False (planning probes,
+        which are deleted again) the slots are paced but not counted.
+        """
+        if self.closed or (quota and self.quota_left(user_id) == 0):
+            return 0
+        now = self.clock()
+        if not any(self._queues) and max(self._global_last + 1 / self.global_rate,
+                                          self._user_ready(user_id), self._paused_until) <= now:
+            return self._grant(user_id, count, priority, quota, now)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queues[priority],
+                       (self._user_ready(user_id), next(self._seq), user_id, count, quota, future))
+        self._waiting[user_id] = self._waiting.get(user_id, 0) + 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._run_dispatcher())
+        else:
+            self._dispatch_event.set()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted, but the sender is gone before it could send
+                self.refund(user_id, future.result())
+            raise
+        finally:
+            self._waiting[user_id] -= 1
+            if not self._waiting[user_id]:
+                del self._waiting[user_id]
+
+    def _head(self, queue):
+        """First live entry of a class queue, with its time brought up to date"""
+        while queue:
+            entry = queue[0]
+            if entry[5].done():
+                heapq.heappop(queue)
+                continue
+            ready = self._user_ready(entry[2])
+            if ready > entry[0]:
+                heapq.heapreplace(queue, (ready,) + entry[1:])
+                continue
+            return entry
+        return None
+
+    def _dispatch(self):
+        """Grant the next slot if it is due; otherwise return when it will be"""
+        if self.closed:
+            for queue in self._queues:
+                for entry in queue:
+                    if not entry[5].done():
+                        entry[5].set_result(0)
+                queue.clear()
+            return None
+        now = self.clock()
+        heads = [self._head(queue) for queue in self._queues]
+        if not any(heads):
+            return None
+        slot_ready = max(self._global_last + 1 / self.global_rate, self._paused_until)
+        first_ready = min(head[0] for head in heads if head)
+        if slot_ready > now or first_ready > now:
+            return max(slot_ready, first_ready)
+        # Only senders that can go now compete; one held back by its own
+        # user cap would leave the slot unused
+        ready = [head is not None and head[0] <= now for head in heads]
+        if ready[BULK] and not self._bulk_yields():
+            priority = BULK
+        else:
+            priority = ready.index(True)
+        _, _, user_id, count, quota, future = heapq.heappop(self._queues[priority])
+        future.set_result(self._grant(user_id, count, priority, quota, now))
+        return None
+
+    async def _run_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        while any(self._queues):
+            due = self._dispatch()
+            if due is None:
+                continue
+            self._dispatch_event.clear()
+            timer = loop.call_later(due - self.clock(), self._dispatch_event.set)
+            try:
+                await self._dispatch_event.wait()
+            finally:
+                timer.cancel()
+
+    def _changed(self, user_id=None):
+        """Rates changed (for one user, or everyone): re-time the queues and re-check"""
+        if user_id is None or user_id in self._waiting:
+            for queue in self._queues:
+                queue[:] = [(self._user_ready(entry[2]),) + entry[1:] for entry in queue]
+                heapq.heapify(queue)
+        self._dispatch_event.set()
+
+    def close(self):
+        """Shutdown has started: waiting senders give up instead of sending"""
+        self.closed = True
+        self._dispatch_event.set()
+
+    def pause_for(self, seconds):
+        """Hold every send for `seconds` after Telegram answers RetryAfter"""
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        logger.warning(f"Flood control: all sends paused for {seconds:g}s")
+
+    def refund(self, user_id, count, quota=True):
+        """Give back slots that ended up not being sent: their quota and their send time.
+
+        quota=False for slots acquired with quota=False, which weren't counted.
+        """
+        if count <= 0:
+            return
+        usage = self.usage.get(user_id)
+        if quota and usage is not None:
+            usage[1] = max(0, usage[1] - count)
+        self._global_last -= count / self.global_rate
+        if user_id in self._user_last:
+            self._user_last[user_id] -= count / self.rate_for(user_id)
+        self._changed(user_id)
+
+    # ==================== PARKING ====================
+    def wake_later(self, key, delay, callback):
+        """Call `callback(key)` after `delay` seconds.
+
+        An idle job parks here as one heap entry instead of a sleeping task;
+        a single timer task wakes every parked job when it is due.
+        """
+        heapq.heappush(self._parked, (self.clock() + delay, key, callback))
+        if self._waker is None or self._waker.done():
+            self._waker = asyncio.get_running_loop().create_task(self._run_waker())
+        else:
+            self._wake_event.set()  # re-check in case this one is due first
+
+    @property
+    def parked_count(self):
+        return len(self._parked)
+
+    async def _run_waker(self):
+        while self._parked:
+            due_in = self._parked[0][0] - self.clock()
+            if due_in > 0:
+                self._wake_event.clear()
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout=due_in)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, key, callback = heapq.heappop(self._parked)
+            try:
+                callback(key)
+            except Exception as e:
+                logger.error(f"Could not wake job {key}: {e}")
+
+    def forget(self, user_id):
+        """Drop pacing state for a finished job"""
+        if self._user_last.pop(user_id, None) is not None:
+            self._changed(user_id)
+
+# Create global instance
+scheduler = ForwardScheduler()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently, but one at a time per user/chat.
+
+    Updates from the same user (or chat, when there is no user) run in arrival
+    order so setup state in ``context.user_data`` can't race, while different
+    users run in parallel up to ``max_concurrent_updates``.
+    """
+
+    def __init__(self, max_concurrent_updates, max_queued_updates=None):
+        # The base semaphore only bounds how many updates may be queued here;
+        # the real concurrency cap is taken *after* the per-user lock so that
+        # one user's backlog can't hold global slots while it waits its turn.
+        super().__init__(max_queued_updates or max_concurrent_updates * 16)
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}
+        self._waiters = {}
+        self._slot_limit = max_concurrent_updates
+
+    @property
+    def concurrency_limit(self):
+        """Maximum number of updates running handlers at the same time"""
+        return self._slot_limit
+
+    @staticmethod
+    def serialization_key(update):
+        """Return the key updates are serialized on, or None for no ordering"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return ('user', user.id)
+        chat = getattr(update, 'effective_chat', None)
+        if chat is not None:
+            return ('chat', chat.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        """Run the handler coroutine under its user lock and a global slot"""
+        key = self.serialization_key(update)
+        if key is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                async with self._slots:
+                    await coroutine
+        finally:
+            # Drop the lock once nobody is waiting on it so idle users cost nothing
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    async def initialize(self):
+        """Nothing to allocate up front"""
+
+    async def shutdown(self):
+        """Log any users whose updates were still pending"""
+        if self._waiters:
+            logger.info(f"Update processor shutting down with {len(self._waiters)} busy users")
@@ -0,0 +1,78 @@
+import asyncio
+import selectors
+import time
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Selector that jumps the clock to the next timer when nothing else can wake the loop"""
+
+    def __init__(self, loop_clock):
+        super().__init__()
+        self._clock = loop_clock
+        self.baseline = 0  # fds the loop registers for itself (its self-pipe)
+
+    def select(self, timeout=None):
+        if len(self.get_map()) > self.baseline:
+            # Real I/O is registered: wait for it for real, and let the
+            # clock follow the time that actually passed
+            start = time.monotonic()
+            events = super().select(timeout)
+            self._clock.advance(time.monotonic() - start)
+            return events
+        events = super().select(0)
+        if not events and timeout:
+            self._clock.advance(timeout)
+        return events
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock jumps straight to the next timer.
+
+    Everything that times itself with the loop clock (the scheduler, retry
+    backoff, parked jobs, burst/rest cycles) runs unchanged, but sleeps cost
+    no real time, so hours of forwarding simulate in seconds. The clock only
+    jumps while no sockets or pipes are open; as soon as real I/O is
+    registered the loop waits for it in real time, so simulations should
+    talk to in-process fakes (like tests/fake_telegram.py) instead.
+    """
+
+    def __init__(self, start=0.0):
+        self.now = start
+        selector = _VirtualSelector(self)
+        super().__init__(selector)
+        selector.baseline = len(selector.get_map())
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+def _cancel_all_tasks(loop):
+    """Cancel whatever main left running and wait for it, like asyncio.run()"""
+    tasks = asyncio.all_tasks(loop)
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler({
+                'message': 'unhandled exception during virtual_time.run() shutdown',
+                'exception': task.exception(),
+                'task': task,
+            })
+
+def run(main, start=0.0):
+    """asyncio.run() on a virtual-time loop; returns main's result"""
+    loop = VirtualTimeLoop(start)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()